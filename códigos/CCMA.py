@@ -1,8 +1,12 @@
-import csv
 import numpy as np
 import os
+from collections import deque
 from obspy import UTCDateTime
 
+from almacen import (exportar_csv_serie, guardar_acumuladores_std, guardar_serie_dia,
+                     leer_acumuladores_std, leer_serie_dia, ruta_serie_anual)
+from calculos import acumular_signos, media_movil_no_nulos, std_simetrica
+
 # --------------------------------------------------------------------------------
 # 1. PARÁMETROS PRINCIPALES
 # --------------------------------------------------------------------------------
@@ -23,6 +27,38 @@ twin_mvave_list = [3000, 3000, 3000, 3000]  # Ventana en número de muestras
 min_data_list   = [2200,  2200,  2200,  2200 ]  # Mínimo de muestras válidas
 dt_cc = 5  # Se mantiene la necesidad de dt_cc para indexar datos
 
+# CC y CCMA se leen/guardan en .npy anuales float32 por estación;
+# con True se escribe además el {date}.csv de texto de cada día
+ccma_csv = False
+
+# --------------------------------------------------------------------------------
+# Funciones auxiliares
+# --------------------------------------------------------------------------------
+def cargar_cc_dia(fn_cc_head, station, day):
+    """
+    Lee la CC de un día desde los .npy anuales (float64).
+    Si falta el día, devuelve ceros de tamaño int(86400 / dt_cc).
+    """
+    cc_day = leer_serie_dia(fn_cc_head, station, day.year, day.julday)
+    if cc_day is None:
+        return np.zeros(int(86400 // dt_cc))
+    return np.asarray(cc_day, dtype=np.float64)
+
+def acumular_std_anual(fn_out_head, station, year):
+    """
+    Acumuladores [n_pos, ss_pos, n_neg, ss_neg] de todos los días procesados
+    (filas sin NaN) del .npy anual de CCMA de la estación, no solo de los
+    calculados en esta corrida.
+    """
+    acum = np.zeros(4)
+    ruta = ruta_serie_anual(fn_out_head, station, year)
+    if not os.path.exists(ruta):
+        return acum
+    for fila in np.load(ruta, mmap_mode="r"):
+        if not np.isnan(fila[0]):
+            acum += acumular_signos(fila)
+    return acum
+
 # --------------------------------------------------------------------------------
 # 2. BUCLE SOBRE LAS COMBINACIONES DE FRECUENCIA
 # --------------------------------------------------------------------------------
@@ -37,8 +73,9 @@ for hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max in zip(
     # Asegurarse de que el directorio de salida exista
     os.makedirs(fn_out_head, exist_ok=True)
 
-    # Diccionario para almacenar los valores de CCMA acumulados por estación
-    ccma_values_by_station = {station: [] for station in stations}
+    # Años de CCMA escritos en esta corrida por estación: sus acumuladores de
+    # la std global se rehacen al final desde el .npy anual completo
+    years_by_station = {station: set() for station in stations}
 
     print("===================================================")
     print(f"Calculando CCMA para:")
@@ -58,101 +95,70 @@ for hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max in zip(
         station_outdir = os.path.join(fn_out_head, station)
         os.makedirs(station_outdir, exist_ok=True)
 
+        # Ventana deslizante de 3 días [anterior, actual, siguiente] en memoria:
+        # en cada paso se descarta el más antiguo y solo se lee el "siguiente"
         day = startday
+        tres_dias = deque(
+            (cargar_cc_dia(fn_cc_head, station, d) for d in (day - 86400, day)),
+            maxlen=3
+        )
+
         while day <= endday:
-            # Preparar las rutas para el día anterior, actual y siguiente
-            # (Igual que en tu código original)
-            dates = [day - 86400, day, day + 86400]
-            cc_combined = []
-
-            # Cargar los datos de los tres días
-            for current_day in dates:
-                date_str = f"{current_day.year}{str(current_day.julday).zfill(3)}"
-                fn = os.path.join(fn_cc_head, station, date_str + ".csv")
-
-                if os.path.exists(fn):
-                    with open(fn, newline='') as csvfile:
-                        reader = csv.reader(csvfile)
-                        next(reader)  # Saltar cabecera ["Time (s)", "CC Value"]
-                        # Convertir a array => [[Time(s), CC], [...], ...]
-                        cc_data = np.array([[float(row[0]), float(row[1])] 
-                                            for row in reader])
-                    # De los datos, solo tomamos la segunda columna (CC), índice 1
-                    # => cc_data[:,1]
-                    cc_combined.append(cc_data[:, 1])
-                else:
-                    # Si falta el archivo, llenar con ceros
-                    # Tamaño => int(86400 / dt_cc)
-                    cc_combined.append(np.zeros(int(86400 // dt_cc)))
+            tres_dias.append(cargar_cc_dia(fn_cc_head, station, day + 86400))
 
             # Concatenar los tres días en un solo array
-            cc_combined = np.concatenate(cc_combined)
-            num_points = len(cc_combined)
+            cc_combined = np.concatenate(tres_dias)
 
             # Índices para el día central en el array concatenado
             start_central_day = 86400 // dt_cc
             end_central_day   = 2 * 86400 // dt_cc
 
-            ccma_central = np.zeros(end_central_day - start_central_day)
-
             # Cálculo del promedio móvil (CCMA) solo para el día central
             half_window = int(twin_mvave // (2 * dt_cc))
 
-            for i in range(start_central_day, end_central_day):
-                start_idx = max(0, i - half_window)
-                end_idx   = min(num_points, i + half_window + 1)
-
-                window_data = cc_combined[start_idx:end_idx]
-                # Filtramos los ceros => 'valid_data'
-                valid_data = window_data[window_data != 0]
-
-                # Verificar la cantidad mínima de datos válidos
-                # El original multiplica len(valid_data) * dt_cc y lo compara con min_data
-                # => si len(valid_data)*dt_cc < min_data => 0
-                # Mantenemos esa lógica EXACTA
-                if len(valid_data) * dt_cc < min_data:
-                    ccma_central[i - start_central_day] = 0
-                else:
-                    ccma_central[i - start_central_day] = np.mean(valid_data)
+            # Media de los valores no nulos en cada ventana; si
+            # len(valid_data) * dt_cc < min_data => 0 (misma lógica EXACTA
+            # del bucle original, con sumas acumuladas en vez de una ventana
+            # por muestra)
+            ccma_central = media_movil_no_nulos(
+                cc_combined, half_window, dt_cc, min_data,
+                start_central_day, end_central_day
+            )
 
-            # Guardar solo el resultado del día central
-            date_str = f"{day.year}{str(day.julday).zfill(3)}"
-            output_fn = os.path.join(station_outdir, f"{date_str}.csv")
+            # Guardar solo el resultado del día central en el .npy anual de CCMA
+            guardar_serie_dia(fn_out_head, station, day.year, day.julday, ccma_central)
 
-            with open(output_fn, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(["Tiempo (s)", "CCMA"])
-                for idx, value in enumerate(ccma_central):
-                    writer.writerow([idx * dt_cc, value])
+            # Copia en CSV solo si se pide para inspección
+            if ccma_csv:
+                date_str = f"{day.year}{str(day.julday).zfill(3)}"
+                output_fn = os.path.join(station_outdir, f"{date_str}.csv")
+                exportar_csv_serie(output_fn, ccma_central, dt_cc, ["Tiempo (s)", "CCMA"])
 
-            # Acumular los valores de CCMA (no cero) para la estación
-            ccma_values_by_station[station].extend(ccma_central[ccma_central != 0])
+            years_by_station[station].add(day.year)
 
             day += 86400  # Avanzar al siguiente día
 
         # Fin while day
 
     # Cálculo final de las desviaciones estándar para cada estación
-    for station, ccma_values in ccma_values_by_station.items():
-        ccma_values = np.array(ccma_values)
-
-        positives = ccma_values[ccma_values > 0]
-        negatives = ccma_values[ccma_values < 0]
+    # Distribución simétrica (positivos y su espejo, negativos y su espejo):
+    # la std sale directamente de los acumuladores, std = sqrt(ss / n)
+    for station, years in years_by_station.items():
+        station_outdir = os.path.join(fn_out_head, station)
 
-        if positives.size > 0:
-            sym_pos = np.concatenate([positives, -positives])
-            std_pos = np.std(sym_pos)
-        else:
-            std_pos = 0
+        # Acumuladores (cantidad y suma de cuadrados por signo, CCMA != 0) de
+        # cada año tocado, sobre todos sus días guardados: una corrida parcial
+        # no pisa los días de corridas anteriores del mismo año
+        acum_by_year = {year: acumular_std_anual(fn_out_head, station, year) for year in years}
+        guardar_acumuladores_std(station_outdir, acum_by_year)
 
-        if negatives.size > 0:
-            sym_neg = np.concatenate([negatives, -negatives])
-            std_neg = np.std(sym_neg)
-        else:
-            std_neg = 0
+        # Totales sobre todos los años guardados (campañas de varios años)
+        acum_total = leer_acumuladores_std(station_outdir)
+        n_pos, ss_pos, n_neg, ss_neg = sum(acum_total.values(), np.zeros(4))
+        std_pos = std_simetrica(n_pos, ss_pos)
+        std_neg = std_simetrica(n_neg, ss_neg)
 
         # Guardar los archivos de desviación estándar
-        station_outdir = os.path.join(fn_out_head, station)
         with open(os.path.join(station_outdir, "std_pos.txt"), 'w') as file:
             file.write(f"{std_pos:.6f}\n")
 
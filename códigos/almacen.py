@@ -0,0 +1,313 @@
+import os
+import csv
+import numpy as np
+
+# --------------------------------------------------------------------------------
+# Formatos binarios en disco compartidos entre etapas
+# --------------------------------------------------------------------------------
+
+# ---------------------------------------------------
+# Clasificación de rms.py (rms_clas)
+#   Un archivo .npy por estación y año: matriz uint8 (366 x num_intervals)
+#   con los códigos de calculos.CLASES; la fila es el día juliano - 1.
+#   Los días sin procesar quedan con SIN_CLAS.
+# ---------------------------------------------------
+SIN_CLAS = 255
+DIAS_ANIO = 366
+
+def ruta_clas_anual(dir_clas, station, year):
+    """Ruta del archivo anual de clasificación: {station}_{year}_clas.npy"""
+    return os.path.join(dir_clas, f"{station}_{year}_clas.npy")
+
+def _abrir_anual(ruta, dtype, n_por_dia, relleno):
+    """
+    Abre como memmap r+ una matriz anual (DIAS_ANIO x n_por_dia) guardada en
+    .npy; si no existe la crea llena con relleno (en un temporal que luego se
+    renombra, para no dejar archivos a medias).
+    """
+    if not os.path.exists(ruta):
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        tmp = ruta + ".tmp"
+        arr = np.lib.format.open_memmap(
+            tmp, mode="w+", dtype=dtype, shape=(DIAS_ANIO, n_por_dia)
+        )
+        arr[:] = relleno
+        arr.flush()
+        del arr
+        os.replace(tmp, ruta)
+
+    arr = np.load(ruta, mmap_mode="r+")
+    if arr.shape[1] != n_por_dia:
+        raise ValueError(
+            f"{ruta} tiene {arr.shape[1]} muestras por día, se esperaban {n_por_dia}"
+        )
+    return arr
+
+def abrir_clas_anual(dir_clas, station, year, num_intervals):
+    """
+    Abre (o crea, lleno de SIN_CLAS) el archivo anual de clasificación como
+    memmap de lectura/escritura.
+    """
+    ruta = ruta_clas_anual(dir_clas, station, year)
+    return _abrir_anual(ruta, np.uint8, num_intervals, SIN_CLAS)
+
+def guardar_clas_dia(dir_clas, station, year, julday, categories):
+    """Escribe la clasificación (códigos uint8) de un día en su archivo anual."""
+    clas = abrir_clas_anual(dir_clas, station, year, len(categories))
+    clas[julday - 1] = categories
+    clas.flush()
+
+def leer_clas_dia(dir_clas, station, year, julday):
+    """
+    Devuelve la clasificación de un día (vista uint8 sobre el memmap, sin
+    parseo) o None si el archivo anual no existe o el día no fue procesado.
+    """
+    ruta = ruta_clas_anual(dir_clas, station, year)
+    if not os.path.exists(ruta):
+        return None
+    fila = np.load(ruta, mmap_mode="r")[julday - 1]
+    if fila[0] == SIN_CLAS:
+        return None
+    return fila
+
+# ---------------------------------------------------
+# Series de CC y CCMA (rejilla fija de dt_cc segundos)
+#   Un archivo .npy por estación y año: {dir_serie}/{station}/{year}.npy,
+#   matriz float32 (366 x 86400/dt_cc); la fila es el día juliano - 1.
+#   Validez: NaN = día sin procesar (equivale al CSV ausente),
+#            0   = muestra sin datos suficientes (igual que en los CSV).
+# ---------------------------------------------------
+
+def ruta_serie_anual(dir_serie, station, year):
+    """Ruta del archivo anual de una serie: {dir_serie}/{station}/{year}.npy"""
+    return os.path.join(dir_serie, station, f"{year}.npy")
+
+def guardar_serie_dia(dir_serie, station, year, julday, valores):
+    """Escribe los valores de un día (se guardan en float32) en su archivo anual."""
+    ruta = ruta_serie_anual(dir_serie, station, year)
+    serie = _abrir_anual(ruta, np.float32, len(valores), np.nan)
+    serie[julday - 1] = valores
+    serie.flush()
+
+def leer_serie_dia(dir_serie, station, year, julday):
+    """
+    Devuelve los valores de un día (vista float32 sobre el memmap, sin
+    parseo) o None si el archivo anual no existe o el día no fue procesado.
+    """
+    ruta = ruta_serie_anual(dir_serie, station, year)
+    if not os.path.exists(ruta):
+        return None
+    fila = np.load(ruta, mmap_mode="r")[julday - 1]
+    if np.isnan(fila[0]):
+        return None
+    return fila
+
+def anios_serie(dir_serie, station):
+    """Lista ordenada de los años con archivo anual de la estación."""
+    station_folder = os.path.join(dir_serie, station)
+    if not os.path.exists(station_folder):
+        return []
+
+    anios = []
+    for file_name in os.listdir(station_folder):
+        nombre, ext = os.path.splitext(file_name)
+        if ext == ".npy" and nombre.isdigit():
+            anios.append(int(nombre))
+    return sorted(anios)
+
+def dias_serie_anio(dir_serie, station, year):
+    """Lista ordenada de los julday con datos en el archivo anual de un año."""
+    serie = np.load(ruta_serie_anual(dir_serie, station, year), mmap_mode="r")
+    return [int(fila) + 1 for fila in np.flatnonzero(~np.isnan(serie[:, 0]))]
+
+def dias_serie(dir_serie, station):
+    """
+    Lista ordenada de (year, julday) con datos en los archivos anuales de la
+    estación.
+    """
+    return [
+        (year, julday)
+        for year in anios_serie(dir_serie, station)
+        for julday in dias_serie_anio(dir_serie, station, year)
+    ]
+
+def exportar_csv_serie(ruta_csv, valores, dt, cabecera):
+    """
+    Exporta un día de la serie al CSV de texto de siempre (tiempo, valor).
+    Se escribe en un temporal que luego se renombra, para no dejar archivos
+    a medias.
+    """
+    tiempos = np.arange(len(valores)) * dt
+    tmp = ruta_csv + ".tmp"
+    with open(tmp, "w", newline="") as csvfile:
+        csvfile.write(",".join(cabecera) + "\n")
+        for t, v in zip(tiempos, valores):
+            csvfile.write(f"{t},{v}\n")
+    os.replace(tmp, ruta_csv)
+
+# ---------------------------------------------------
+# Acumuladores de la std global de CCMA.py
+#   {dir_ccma}/{station}/std_acum.csv con una fila por año:
+#   year, n_pos, ss_pos, n_neg, ss_neg
+#   (cantidad y suma de cuadrados de los CCMA positivos y negativos)
+# ---------------------------------------------------
+ARCHIVO_ACUM_STD = "std_acum.csv"
+
+def leer_acumuladores_std(station_dir):
+    """Devuelve {year: array([n_pos, ss_pos, n_neg, ss_neg])} ({} si no hay archivo)."""
+    ruta = os.path.join(station_dir, ARCHIVO_ACUM_STD)
+    acum = {}
+    if not os.path.exists(ruta):
+        return acum
+    with open(ruta, "r") as f:
+        next(f, None)  # cabecera
+        for linea in f:
+            partes = linea.strip().split(",")
+            if len(partes) < 5:
+                continue
+            acum[int(partes[0])] = np.array([float(v) for v in partes[1:5]])
+    return acum
+
+def guardar_acumuladores_std(station_dir, acum_nuevos):
+    """
+    Guarda los acumuladores por año de la estación. Los años de acum_nuevos
+    reemplazan a los que ya estaban; los demás años se conservan, de modo
+    que campañas de varios años se combinan sin guardar valores crudos.
+    """
+    acum = leer_acumuladores_std(station_dir)
+    acum.update(acum_nuevos)
+    ruta = os.path.join(station_dir, ARCHIVO_ACUM_STD)
+    tmp = ruta + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("year,n_pos,ss_pos,n_neg,ss_neg\n")
+        for year in sorted(acum):
+            n_pos, ss_pos, n_neg, ss_neg = acum[year]
+            f.write(f"{year},{int(n_pos)},{float(ss_pos)!r},{int(n_neg)},{float(ss_neg)!r}\n")
+    os.replace(tmp, ruta)
+
+# ---------------------------------------------------
+# Estadísticos diarios de CCMA guardados por std.py (modo incremental)
+#   .npz con day_str (array de 'YYYYDDD'), stats (n_días x k), los
+#   parámetros de la ventana con que se calcularon y el mtime de cada
+#   archivo anual de CCMA leído (years, mtimes)
+# ---------------------------------------------------
+
+def leer_stats_dias(ruta):
+    """
+    Devuelve ({day_str: fila de estadísticos}, parametros, {year: mtime}).
+    Si el archivo no existe => ({}, None, {}); si es de una versión sin
+    parámetros o mtimes, esos quedan en None y {}.
+    """
+    if not os.path.exists(ruta):
+        return {}, None, {}
+    with np.load(ruta) as datos:
+        stats = dict(zip(datos["day_str"].tolist(), datos["stats"]))
+        parametros = datos["parametros"] if "parametros" in datos else None
+        mtimes = {}
+        if "years" in datos:
+            mtimes = dict(zip(datos["years"].tolist(), datos["mtimes"].tolist()))
+    return stats, parametros, mtimes
+
+def guardar_stats_dias(ruta, day_str_list, stats, parametros, mtimes):
+    """Guarda los estadísticos diarios (escritura atómica vía temporal)."""
+    years = sorted(mtimes)
+    tmp = ruta + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f, day_str=np.array(day_str_list, dtype="U7"), stats=stats,
+            parametros=np.asarray(parametros, dtype=np.float64),
+            years=np.array(years, dtype=np.int64),
+            mtimes=np.array([mtimes[y] for y in years], dtype=np.float64),
+        )
+    os.replace(tmp, ruta)
+
+# ---------------------------------------------------
+# Detecciones por bloque (detection.py -> Total.py -> red.py)
+#   CSV de texto con columnas time, type (neg/pos), value; las marcas de
+#   tiempo caen en una malla regular de interval_hours.
+#   En memoria: malla datetime64[s] y matriz (n_bloques x 2) [neg, pos].
+# ---------------------------------------------------
+TIPOS_DETECCION = ("neg", "pos")
+
+def malla_bloques(inicio, fin, interval_hours):
+    """Malla datetime64[s] de inicio a fin (ambos incluidos) cada interval_hours."""
+    paso = np.timedelta64(int(interval_hours * 3600), "s")
+    inicio = np.datetime64(inicio, "s")
+    fin = np.datetime64(fin, "s")
+    return np.arange(inicio, fin + paso, paso)
+
+def _a_float(texto):
+    try:
+        return float(texto)
+    except ValueError:
+        return np.nan
+
+def _leer_filas_detecciones(ruta_csv):
+    """Filas [time, type, value, ...] del CSV de detecciones ([] si no existe)."""
+    if not os.path.exists(ruta_csv):
+        return []
+    with open(ruta_csv, "r", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # ["time", "type", "value"]
+        return [fila for fila in reader if len(fila) >= 3]
+
+def _indices_malla(tiempos, malla):
+    """Índice de bloque de cada tiempo y máscara de los que caen en la malla."""
+    paso = int((malla[1] - malla[0]) / np.timedelta64(1, "s")) if len(malla) > 1 else 1
+    desfase = (tiempos - malla[0]).astype(np.int64)
+    indice = desfase // paso
+    en_malla = (desfase % paso == 0) & (indice >= 0) & (indice < len(malla))
+    return indice, en_malla
+
+def leer_detecciones_bloques(ruta_csv, malla):
+    """
+    Lee un CSV (time, type, value) sobre la malla de bloques.
+    Devuelve una matriz (len(malla) x 2) con el valor máximo de cada bloque
+    para neg y pos (0.0 donde no hay filas). Se ignoran las filas fuera de
+    la malla, con tipo desconocido o valor no numérico.
+    """
+    bloques = np.zeros((len(malla), 2))
+    filas = _leer_filas_detecciones(ruta_csv)
+    if not filas or len(malla) == 0:
+        return bloques
+
+    tiempos = np.array([fila[0] for fila in filas], dtype="datetime64[s]")
+    columna = np.array([
+        TIPOS_DETECCION.index(fila[1]) if fila[1] in TIPOS_DETECCION else -1
+        for fila in filas
+    ])
+    valores = np.array([_a_float(fila[2]) for fila in filas])
+
+    indice, en_malla = _indices_malla(tiempos, malla)
+    validas = en_malla & (columna >= 0) & np.isfinite(valores)
+    np.maximum.at(bloques, (indice[validas], columna[validas]), valores[validas])
+    return bloques
+
+def leer_presencia_bloques(ruta_csv, malla):
+    """
+    Máscara booleana (len(malla)) de los bloques con al menos una fila en el
+    CSV de detecciones, sin importar tipo ni valor.
+    """
+    presencia = np.zeros(len(malla), dtype=bool)
+    filas = _leer_filas_detecciones(ruta_csv)
+    if not filas or len(malla) == 0:
+        return presencia
+
+    tiempos = np.array([fila[0] for fila in filas], dtype="datetime64[s]")
+    indice, en_malla = _indices_malla(tiempos, malla)
+    presencia[indice[en_malla]] = True
+    return presencia
+
+def guardar_detecciones_bloques(ruta_csv, malla, bloques):
+    """
+    Escribe el CSV (time, type, value) con los bloques distintos de cero,
+    en orden de tiempo y neg antes que pos.
+    """
+    tiempos = np.datetime_as_string(malla, unit="s")
+    with open(ruta_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "type", "value"])
+        for i in np.flatnonzero((bloques != 0).any(axis=1)):
+            for j, tipo in enumerate(TIPOS_DETECCION):
+                if abs(bloques[i, j]) > 0:
+                    writer.writerow([tiempos[i], tipo, f"{bloques[i, j]:.6e}"])
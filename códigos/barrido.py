@@ -0,0 +1,247 @@
+import os
+import csv
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+from obspy import UTCDateTime
+
+from almacen import leer_serie_dia, malla_bloques
+from calculos import (pesos_excedencia, rasterizar_intervalos, suma_ventana_dias,
+                      sumas_por_bloque, umbrales_utilizables)
+
+#--------------------------------------------------------------------
+# Barrido de parámetros de detection.py
+#   Carga CCMA y std diarios una sola vez en arrays, evalúa una grilla de
+#   (threshold_neg, threshold_pos, days, factor_comparison, weight_for_bigger)
+#   en paralelo y califica cada combinación contra el catálogo sse_events.
+#   Resultado: una sola tabla CSV, sin figuras.
+#--------------------------------------------------------------------
+
+#--------------------------------------------------------------------
+# 1. Parámetros de entrada (mismos directorios que detection.py)
+#--------------------------------------------------------------------
+stations = ["RIOS", "CCOL", "PJIM", "TSKT"]
+
+startday = UTCDateTime(2022, 1, 1)
+endday   = UTCDateTime(2022, 12, 31)
+
+input_dir = r"T:\ULTIMOS22\3000 s\0.02_0.05__2_8\ccma"
+std_dir   = r"T:\ULTIMOS22\3000 s\0.02_0.05__2_8\std"
+
+# Tabla de resultados del barrido
+output_csv = r"T:\ULTIMOS22\3000 s\0.02_0.05__2_8\barrido_umbrales.csv"
+
+interval_hours = 2
+
+#--------------------------------------------------------------------
+# 2. Grilla de parámetros a evaluar
+#--------------------------------------------------------------------
+threshold_neg_list     = [3, 3.5, 4, 4.5, 5]
+threshold_pos_list     = [3, 3.5, 4, 4.5, 5]
+days_list              = [3, 5, 7, 10, 30]
+factor_comparison_list = [1.0, 1.15, 1.3]
+weight_for_bigger_list = [0.8, 1]
+
+# Procesos en paralelo (None => todos los núcleos)
+n_workers = None
+
+# Catálogo de SSE contra el que se califica cada combinación
+sse_events = [
+    (datetime(2022, 1, 30), datetime(2022, 3, 14), 6.5),
+    (datetime(2022, 4, 8), datetime(2022, 5, 8), 6.7)
+]
+
+#--------------------------------------------------------------------
+# 3. Carga de datos (una sola vez, en el proceso principal)
+#--------------------------------------------------------------------
+def cargar_datos():
+    """
+    Devuelve {station: (ccma, std_neg, std_pos, con_datos)} con
+      ccma: matriz float32 (n_días x muestras_por_día), ceros en días sin datos
+      std_neg, std_pos: arrays por día (0.0 si no hay std ese día)
+      con_datos: máscara de los días con CCMA de la estación
+    y la lista de fechas (datetime) de cada día.
+    """
+    fechas = []
+    day = startday
+    while day <= endday:
+        fechas.append(day)
+        day += 86400
+
+    datos = {}
+    for station in stations:
+        daily_std = {}
+        csv_path = os.path.join(std_dir, f"{station}.csv")
+        if os.path.exists(csv_path):
+            with open(csv_path, 'r', newline='') as f:
+                reader = csv.reader(f)
+                header = next(reader, None)  # [day_str, std_neg, std_pos]
+                for row in reader:
+                    if len(row) < 3:
+                        continue
+                    try:
+                        daily_std[row[0]] = (float(row[1]), float(row[2]))
+                    except ValueError:
+                        continue
+
+        filas = [leer_serie_dia(input_dir, station, d.year, d.julday) for d in fechas]
+        muestras = next((len(f) for f in filas if f is not None), 0)
+        if muestras == 0:
+            continue
+
+        ccma = np.zeros((len(fechas), muestras), dtype=np.float32)
+        std_neg = np.zeros(len(fechas))
+        std_pos = np.zeros(len(fechas))
+        con_datos = np.array([fila is not None for fila in filas])
+        for i, (d, fila) in enumerate(zip(fechas, filas)):
+            if fila is not None:
+                ccma[i] = fila
+            date_str = f"{d.year}{str(d.julday).zfill(3)}"
+            std_neg[i], std_pos[i] = daily_std.get(date_str, (0.0, 0.0))
+
+        datos[station] = (ccma, std_neg, std_pos, con_datos)
+
+    return datos, [d.datetime for d in fechas]
+
+# Datos globales de cada proceso del pool: se leen una sola vez en el
+# proceso principal y llegan a cada worker por initargs
+_datos = None
+_fechas = None
+
+def _inicializar(datos, fechas):
+    global _datos, _fechas
+    _datos, _fechas = datos, fechas
+
+#--------------------------------------------------------------------
+# 4. Evaluación de una combinación de umbrales
+#--------------------------------------------------------------------
+def horas_acumuladas(ccma, std_neg, std_pos, threshold_neg, threshold_pos,
+                     factor_comparison, weight_for_bigger):
+    """
+    Exceedances por bloque de 2 horas (n_días x bloques_por_día) de neg y pos
+    con la misma lógica de detection.py, y el intervalo de muestreo (s).
+    """
+    muestras = ccma.shape[1]
+    sampling_interval_s = 86400 / muestras
+    samples_per_block = int((interval_hours * 3600) // sampling_interval_s)
+    bloques_por_dia = -(-muestras // samples_per_block)
+
+    usable_neg, usable_pos = umbrales_utilizables(
+        std_neg, std_pos, threshold_neg, threshold_pos,
+        factor_comparison, weight_for_bigger
+    )
+
+    bloques_neg = np.zeros((len(ccma), bloques_por_dia))
+    bloques_pos = np.zeros((len(ccma), bloques_por_dia))
+    for d in range(len(ccma)):
+        pesos_neg, pesos_pos = pesos_excedencia(
+            np.asarray(ccma[d], dtype=np.float64), usable_neg[d], usable_pos[d], std_neg[d], std_pos[d],
+            threshold_neg, threshold_pos
+        )
+        _, bloques_neg[d] = sumas_por_bloque(pesos_neg, samples_per_block)
+        _, bloques_pos[d] = sumas_por_bloque(pesos_pos, samples_per_block)
+
+    return bloques_neg, bloques_pos, sampling_interval_s
+
+def calificar(detectado, tiempos):
+    """
+    Compara los bloques detectados con sse_events (solo los que caen en el
+    rango analizado). Devuelve (eventos, aciertos, horas en eventos,
+    horas de falsas alarmas).
+    """
+    en_evento = np.zeros(len(tiempos), dtype=bool)
+    eventos = 0
+    aciertos = 0
+    for inicio, fin, _ in sse_events:
+        dentro = rasterizar_intervalos(tiempos, [(inicio, fin)])
+        if not dentro.any():
+            continue
+        eventos += 1
+        aciertos += int(detectado[dentro].any())
+        en_evento |= dentro
+
+    horas_eventos = int((detectado & en_evento).sum()) * interval_hours
+    horas_falsas  = int((detectado & ~en_evento).sum()) * interval_hours
+    return eventos, aciertos, horas_eventos, horas_falsas
+
+def evaluar(params):
+    """
+    Evalúa (threshold_neg, threshold_pos, factor_comparison, weight_for_bigger)
+    para todas las estaciones y todos los valores de days_list.
+    Un bloque se detecta, como en detection.py, cuando las horas acumuladas
+    (neg o pos) superan su promedio. Los huecos se tratan igual que allí:
+      - día sin datos en ninguna estación: 24 / interval_hours valores 0 en
+        todas, sin tocar las ventanas
+      - día sin datos solo en esta estación: no aporta valores
+    y el promedio es el de los valores que detection.py efectivamente guarda.
+    """
+    threshold_neg, threshold_pos, factor_comparison, weight_for_bigger = params
+    alguno = np.any([con_datos for *_, con_datos in _datos.values()], axis=0)
+    filas = []
+    for station, (ccma, std_neg, std_pos, con_datos) in _datos.items():
+        bloques_neg, bloques_pos, sampling_interval_s = horas_acumuladas(
+            ccma, std_neg, std_pos, threshold_neg, threshold_pos,
+            factor_comparison, weight_for_bigger
+        )
+        bloques_por_dia = bloques_neg.shape[1]
+        tiempos = malla_bloques(
+            _fechas[0],
+            _fechas[-1] + timedelta(hours=interval_hours * (bloques_por_dia - 1)),
+            interval_hours
+        )
+
+        # Valores que detection.py guarda: bloques_por_dia en los días con
+        # datos de la estación y 24 / interval_hours ceros en los días vacíos
+        n_valores = con_datos.sum() * bloques_por_dia + (~alguno).sum() * (24 // interval_hours)
+
+        for days in days_list:
+            horas_neg = suma_ventana_dias(bloques_neg, days) * sampling_interval_s / 3600.0
+            horas_pos = suma_ventana_dias(bloques_pos, days) * sampling_interval_s / 3600.0
+            media_neg = horas_neg[con_datos].sum() / n_valores if n_valores else 0
+            media_pos = horas_pos[con_datos].sum() / n_valores if n_valores else 0
+
+            detectado = (horas_neg > media_neg) | (horas_pos > media_pos)
+            # Días sin datos de la estación: sin valor (no se detectan), salvo
+            # los vacíos en todas, que valen 0
+            detectado[~con_datos] = False
+            detectado[~alguno] = 0 > media_neg or 0 > media_pos
+            detectado = detectado.ravel()
+
+            eventos, aciertos, horas_eventos, horas_falsas = calificar(detectado, tiempos)
+            filas.append([
+                station, threshold_neg, threshold_pos, days,
+                factor_comparison, weight_for_bigger,
+                eventos, aciertos,
+                f"{aciertos / eventos:.3f}" if eventos else "",
+                horas_eventos, horas_falsas
+            ])
+    return filas
+
+#--------------------------------------------------------------------
+# 5. Ejecución del barrido
+#--------------------------------------------------------------------
+if __name__ == "__main__":
+    grilla = list(itertools.product(
+        threshold_neg_list, threshold_pos_list,
+        factor_comparison_list, weight_for_bigger_list
+    ))
+    print(f"Evaluando {len(grilla) * len(days_list)} combinaciones por estación...")
+
+    datos, fechas = cargar_datos()
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_inicializar,
+                             initargs=(datos, fechas)) as pool:
+        resultados = list(pool.map(evaluar, grilla, chunksize=4))
+
+    with open(output_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            "station", "threshold_neg", "threshold_pos", "days",
+            "factor_comparison", "weight_for_bigger",
+            "eventos", "aciertos", "tasa_aciertos",
+            "horas_deteccion_eventos", "horas_falsas_alarmas"
+        ])
+        for filas in resultados:
+            writer.writerows(filas)
+
+    print("Barrido completado. Resultados en:", output_csv)
@@ -0,0 +1,180 @@
+import os
+import json
+from collections import OrderedDict
+import numpy as np
+from obspy import Stream, Trace, UTCDateTime
+
+from inventario import firma_dia
+
+# --------------------------------------------------------------------------------
+# Cachés de resultados intermedios reutilizables entre combinaciones de frecuencia
+# y entre corridas
+# --------------------------------------------------------------------------------
+
+class CacheLRU:
+    """
+    Caché en memoria acotada por tamaño (en bytes) con desalojo LRU.
+
+    Pensada para arrays de NumPy: el tamaño de cada entrada es su nbytes.
+    Cuando una entrada nueva no cabe se descartan las usadas hace más tiempo;
+    una entrada más grande que todo el límite simplemente no se guarda.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes_usados = 0
+        self._datos = OrderedDict()
+
+    def __len__(self):
+        return len(self._datos)
+
+    def __contains__(self, clave):
+        return clave in self._datos
+
+    def get(self, clave):
+        """Devuelve el valor guardado (marcándolo como recién usado) o None."""
+        if clave not in self._datos:
+            return None
+        self._datos.move_to_end(clave)
+        return self._datos[clave]
+
+    def put(self, clave, valor):
+        """Guarda valor bajo clave, desalojando entradas antiguas si hace falta."""
+        tam = valor.nbytes
+        if clave in self._datos:
+            self.bytes_usados -= self._datos.pop(clave).nbytes
+        if tam > self.max_bytes:
+            return
+        while self._datos and self.bytes_usados + tam > self.max_bytes:
+            _, viejo = self._datos.popitem(last=False)
+            self.bytes_usados -= viejo.nbytes
+        self._datos[clave] = valor
+        self.bytes_usados += tam
+
+    def clear(self):
+        self._datos.clear()
+        self.bytes_usados = 0
+
+# --------------------------------------------------------------------------------
+# Caché en disco de días crudos ya decodificados (rms.py, cc.py)
+#   {directorio}/{station}_{date}.npy : matriz (3 x npts) con el dtype original
+#   {directorio}/{station}_{date}.json: cabeceras de las trazas y la firma
+#                                       (ruta, size, mtime) de los archivos
+#                                       crudos de los que salió
+#   La clave es solo (station, date): rms.py y cc.py pueden compartir el
+#   directorio aunque sus fn_heads sean distintos.
+# --------------------------------------------------------------------------------
+
+class CacheDias:
+    """
+    Caché opcional de station-days decodificados como .npy que se cargan con
+    mmap (sin volver a descomprimir el miniSEED).
+
+    La firma guardada es la de los archivos crudos que se decodificaron para
+    armar la entrada; una entrada solo vale si esos mismos archivos siguen
+    con el mismo tamaño y mtime (inventario.firma_dia al momento de leer).
+    Si alguno cambió, se ignora y se reescribe. Solo se guardan días con 3
+    trazas de igual npts y dtype.
+    El tamaño total se acota a max_bytes desalojando las entradas usadas
+    hace más tiempo (mtime del .json, que se actualiza en cada acierto).
+    Varios procesos pueden compartir el directorio: cada entrada se escribe
+    en temporales que luego se renombran.
+    """
+
+    def __init__(self, directorio, max_bytes):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        os.makedirs(directorio, exist_ok=True)
+
+    def _rutas(self, station, date):
+        base = os.path.join(self.directorio, f"{station}_{date}")
+        return base + ".npy", base + ".json"
+
+    def get(self, station, date):
+        """
+        Stream del día (datos sobre memmap de solo lectura) o None si no está
+        o si alguno de los archivos crudos de los que salió cambió.
+        """
+        ruta_npy, ruta_meta = self._rutas(station, date)
+        try:
+            with open(ruta_meta, "r") as f:
+                meta = json.load(f)
+            rutas = [ruta for ruta, _, _ in meta["firma"]]
+            if not rutas or meta["firma"] != [list(archivo) for archivo in firma_dia(rutas)]:
+                return None
+            datos = np.load(ruta_npy, mmap_mode="r")
+            os.utime(ruta_meta)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        st = Stream()
+        for fila, cabecera in zip(datos, meta["trazas"]):
+            cabecera = dict(cabecera, starttime=UTCDateTime(cabecera["starttime"]))
+            st += Trace(data=np.asarray(fila), header=cabecera)
+        return st
+
+    def put(self, station, date, firma, st):
+        """
+        Guarda el día si tiene forma válida; firma es la de los archivos con
+        que se armó st (tomada antes de leerlos). Devuelve True si se guardó.
+        """
+        if len(st) != 3 or any(
+            tr.stats.npts != st[0].stats.npts or tr.data.dtype != st[0].data.dtype
+            for tr in st
+        ):
+            return False
+
+        ruta_npy, ruta_meta = self._rutas(station, date)
+        meta = {
+            "firma": [list(archivo) for archivo in firma],
+            "trazas": [
+                {
+                    "network": tr.stats.network,
+                    "station": tr.stats.station,
+                    "location": tr.stats.location,
+                    "channel": tr.stats.channel,
+                    "starttime": str(tr.stats.starttime),
+                    "sampling_rate": tr.stats.sampling_rate,
+                }
+                for tr in st
+            ],
+        }
+        with open(ruta_npy + ".tmp", "wb") as f:
+            np.save(f, np.stack([tr.data for tr in st]))
+        os.replace(ruta_npy + ".tmp", ruta_npy)
+        with open(ruta_meta + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(ruta_meta + ".tmp", ruta_meta)
+
+        self._desalojar()
+        return True
+
+    def _desalojar(self):
+        """Borra las entradas más antiguas hasta quedar en max_bytes."""
+        entradas = []
+        total = 0
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".json"):
+                continue
+            ruta_meta = os.path.join(self.directorio, nombre)
+            ruta_npy = ruta_meta[:-len(".json")] + ".npy"
+            try:
+                tamanos = {ruta_meta: os.path.getsize(ruta_meta), ruta_npy: os.path.getsize(ruta_npy)}
+                usado = os.path.getmtime(ruta_meta)
+            except OSError:
+                continue  # otro proceso la está escribiendo o borrando
+            entradas.append((usado, ruta_meta, tamanos))
+            total += sum(tamanos.values())
+
+        entradas.sort()
+        for _, _, tamanos in entradas:
+            if total <= self.max_bytes:
+                break
+            for ruta, tam in tamanos.items():
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    continue
+                # Solo se descuenta lo que de verdad se liberó (en Windows un
+                # archivo abierto por otro proceso no se puede borrar)
+                total -= tam
@@ -0,0 +1,408 @@
+from collections import deque
+
+import numpy as np
+
+# --------------------------------------------------------------------------------
+# Núcleos numéricos vectorizados compartidos por las etapas del flujo
+# (rms.py, cc.py, CCMA.py, std.py, detection.py)
+# --------------------------------------------------------------------------------
+
+def sumas_ventanas(x, izq, n):
+    """
+    Suma de x[l:l+n] para cada l en izq (todas las ventanas dentro de x),
+    en O(N) sin restar sumas acumuladas de todo el día.
+
+    La serie se parte en bloques de n muestras; una ventana de largo n abarca
+    a lo sumo dos bloques, así que su suma es la cola acumulada del primero
+    más la cabeza acumulada del segundo. Solo se suman términos de la propia
+    ventana y sus vecinos, por lo que un sismo grande en otra hora del día no
+    degrada la precisión (lo que sí ocurre con S[r] - S[l] sobre todo el día).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    izq = np.asarray(izq, dtype=np.int64)
+    m = len(x) // n + 2
+    bloques = np.zeros(m * n)
+    bloques[:len(x)] = x
+    bloques = bloques.reshape(m, n)
+
+    cabeza = np.cumsum(bloques, axis=1)                     # x[k*n : k*n+o+1]
+    cola = np.cumsum(bloques[:, ::-1], axis=1)[:, ::-1]     # x[k*n+o : (k+1)*n]
+
+    k = izq // n
+    o = izq % n
+    suma = cola[k, o]
+    parcial = o > 0
+    suma[parcial] += cabeza[k[parcial] + 1, o[parcial] - 1]
+    return suma
+
+def cc_ventanas(x, y, centros, half_ntwin):
+    """
+    Coeficiente de correlación de Pearson entre x e y en todas las ventanas
+    [centro - half_ntwin, centro + half_ntwin) en una sola pasada, usando
+    sumas por ventana de x, y, x*y, x**2 e y**2 (O(N) en vez de O(N*W)).
+
+    Reproduce el cálculo ventana a ventana de cc.py:
+      - ventanas que se salen de la serie => 0
+      - ventanas con norma nula en x o en y => 0
+    La diferencia con el cálculo directo (np.dot / np.linalg.norm) es menor
+    que 1e-9 en valor absoluto para datos reales. Una varianza menor que
+    1e-12 veces la energía de la ventana (ventana constante salvo redondeo)
+    se considera nula.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    centros = np.asarray(centros, dtype=np.int64)
+    n = 2 * half_ntwin
+
+    cc = np.zeros(len(centros))
+    if n == 0 or len(x) == 0:
+        return cc
+
+    # Solo ventanas completamente dentro de la serie
+    izq = centros - half_ntwin
+    dentro = (izq >= 0) & (centros + half_ntwin <= len(x))
+    l = izq[dentro]
+
+    sx  = sumas_ventanas(x, l, n)
+    sy  = sumas_ventanas(y, l, n)
+    sxx = sumas_ventanas(x * x, l, n)
+    syy = sumas_ventanas(y * y, l, n)
+    sxy = sumas_ventanas(x * y, l, n)
+
+    cov   = sxy - sx * sy / n
+    var_x = sxx - sx * sx / n
+    var_y = syy - sy * sy / n
+
+    # Varianza nula (ventana constante, p.ej. rellena con ceros) => CC = 0
+    validas = (var_x > 1e-12 * sxx) & (var_y > 1e-12 * syy)
+
+    cc_dentro = np.zeros(len(l))
+    cc_dentro[validas] = cov[validas] / np.sqrt(var_x[validas] * var_y[validas])
+    # Por redondeo el cociente puede salirse mínimamente de [-1, 1]
+    np.clip(cc_dentro, -1.0, 1.0, out=cc_dentro)
+
+    cc[dentro] = cc_dentro
+    return cc
+
+def segundos_validos(es_valido, interval_seconds, time_cc, dt_dec, n_dec, half_ntwin):
+    """
+    Segundos de datos válidos (clasificación "b") dentro de cada ventana de CC.
+
+    es_valido: máscara booleana, un elemento por intervalo de clasificación
+               (p.ej. 1440 intervalos de 60 s)
+    time_cc:   centros de ventana en segundos
+    n_dec:     largo de la señal decimada
+
+    Equivale al bucle de cc.py que recorre k en [-half_ntwin, half_ntwin) y
+    suma dt_dec por cada muestra decimada cuya hora cae en un intervalo "b":
+    la máscara se expande una sola vez a la tasa decimada y el conteo de cada
+    ventana sale de una suma acumulada.
+    """
+    es_valido = np.asarray(es_valido, dtype=bool)
+    time_cc = np.asarray(time_cc, dtype=np.float64)
+    i_wave = (time_cc / dt_dec).astype(np.int64)
+    # Desfase entre el centro de la ventana y la muestra decimada i_wave
+    # (0 cuando dt_cc es múltiplo de dt_dec, el caso habitual)
+    desfase = time_cc - i_wave * dt_dec
+
+    conteo = np.zeros(len(time_cc))
+    j = np.arange(n_dec)
+    for d in np.unique(desfase):
+        # Hora (s) de cada muestra decimada vista desde centros con este desfase
+        t = d + j * dt_dec
+        class_index = np.floor_divide(t, interval_seconds).astype(np.int64)
+        mascara = (t >= 0) & (t < 86400) & (class_index >= 0) & (class_index < len(es_valido))
+        mascara[mascara] = es_valido[class_index[mascara]]
+
+        S = np.zeros(n_dec + 1, dtype=np.int64)
+        np.cumsum(mascara, out=S[1:])
+
+        sel = desfase == d
+        l = np.clip(i_wave[sel] - half_ntwin, 0, n_dec)
+        r = np.clip(i_wave[sel] + half_ntwin, 0, n_dec)
+        conteo[sel] = (S[r] - S[l]) * dt_dec
+
+    return conteo
+
+def rms_intervalos(data, ipts0, ipts1):
+    """
+    RMS de data en los intervalos contiguos [ipts0[i], ipts1[i]) (ipts1[i] ==
+    ipts0[i+1]), todos a la vez con np.add.reduceat sobre los cuadrados.
+
+    Los intervalos que se salen de data se recortan (el último puede quedar
+    incompleto) y los que quedan vacíos dan RMS = 0, igual que el bucle por
+    minuto de rms.py.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    ipts0 = np.asarray(ipts0, dtype=np.int64)
+    fin = np.minimum(np.asarray(ipts1, dtype=np.int64), len(data))
+    n = np.maximum(fin - ipts0, 0)
+
+    rms = np.zeros(len(ipts0))
+    con_datos = n > 0
+    if not con_datos.any():
+        return rms
+
+    # Como los intervalos son contiguos, cada suma va desde su inicio hasta el
+    # inicio del siguiente; se corta data al final del último intervalo con datos
+    cuadrados = data[:fin[con_datos].max()] ** 2
+    sumas = np.add.reduceat(cuadrados, ipts0[con_datos])
+    rms[con_datos] = np.sqrt(sumas / n[con_datos])
+    return rms
+
+# Códigos enteros de la clasificación de rms.py (el código es el índice en CLASES)
+CLASES = ["a", "b", "c", "d", "c1"]
+CLAS_A, CLAS_B, CLAS_C, CLAS_D, CLAS_C1 = range(len(CLASES))
+
+def dilatar(mascara, radio):
+    """
+    Dilatación morfológica 1D de una máscara booleana: True en i si hay algún
+    True en [i - radio, i + radio]. Se calcula con una suma acumulada, O(N)
+    sin importar el radio.
+    """
+    mascara = np.asarray(mascara, dtype=bool)
+    n = len(mascara)
+    S = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(mascara, out=S[1:])
+    i = np.arange(n)
+    l = np.clip(i - radio, 0, n)
+    r = np.clip(i + radio + 1, 0, n)
+    return (S[r] - S[l]) > 0
+
+def clasificar_intervalos(rms_lfhor, min_noise_counts, max_noise_counts, radio_c1):
+    """
+    Clasificación de rms.py sobre arrays de códigos enteros (uint8):
+      - "c" si rms_lfhor < min_noise_counts, "a" si > max_noise_counts, si no "b"
+      - "b" pasa a "d" si un vecino inmediato es "a" o "c" (excepto en los
+        extremos del día, como en el bucle original)
+      - todo lo que no es "c" a menos de radio_c1 intervalos de una "c" pasa a "c1"
+    Las reglas de vecindad son dilataciones de las máscaras "a|c" (radio 1)
+    y "c" (radio radio_c1).
+    """
+    rms_lfhor = np.asarray(rms_lfhor)
+    clas = np.full(len(rms_lfhor), CLAS_B, dtype=np.uint8)
+    clas[rms_lfhor > max_noise_counts] = CLAS_A
+    clas[rms_lfhor < min_noise_counts] = CLAS_C
+
+    es_c = clas == CLAS_C
+    vecino_ac = dilatar(es_c | (clas == CLAS_A), 1)
+    vecino_ac[[0, -1]] = False
+    clas[(clas == CLAS_B) & vecino_ac] = CLAS_D
+
+    clas[dilatar(es_c, radio_c1) & ~es_c] = CLAS_C1
+    return clas
+
+def media_movil_no_nulos(x, half_window, dt, min_data, inicio=0, fin=None):
+    """
+    Promedio móvil de CCMA.py para los índices [inicio, fin) de x: media de
+    los valores distintos de cero en [i - half_window, i + half_window]
+    (recortado a los bordes de x), o 0 si len(no_nulos) * dt < min_data.
+
+    Los ceros son datos faltantes: no suman y no cuentan. La suma y el conteo
+    de cada ventana salen de sumas acumuladas (O(N) para todo el día).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    if fin is None:
+        fin = n
+
+    S = np.zeros(n + 1)
+    np.cumsum(x, out=S[1:])
+    C = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(x != 0, out=C[1:])
+
+    i = np.arange(inicio, fin)
+    l = np.maximum(0, i - half_window)
+    r = np.minimum(n, i + half_window + 1)
+
+    conteo = C[r] - C[l]
+    media = np.zeros(len(i))
+    suficientes = conteo * dt >= min_data
+    media[suficientes] = (S[r] - S[l])[suficientes] / conteo[suficientes]
+    return media
+
+# Acumuladores de la std simétrica: [n_pos, ss_pos, n_neg, ss_neg]
+def acumular_signos(valores):
+    """
+    Estadísticos suficientes de la std simétrica de CCMA.py para un conjunto
+    de valores: cantidad y suma de cuadrados de los positivos y de los
+    negativos (los ceros se ignoran). Se pueden sumar entre días y años.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    positivos = valores[valores > 0]
+    negativos = valores[valores < 0]
+    return np.array([
+        positivos.size, np.dot(positivos, positivos),
+        negativos.size, np.dot(negativos, negativos),
+    ])
+
+def std_simetrica(n, suma_cuadrados):
+    """
+    std de concatenate([v, -v]) a partir de n y sum(v**2): la media de la
+    distribución simétrica es 0, así que std = sqrt(sum(v**2) / n).
+    Sin valores => 0.
+    """
+    if n == 0:
+        return 0.0
+    return float(np.sqrt(suma_cuadrados / n))
+
+def umbrales_utilizables(std_neg, std_pos, threshold_neg, threshold_pos,
+                         factor_comparison, weight_for_bigger):
+    """
+    Umbrales diarios de detection.py (con posible unificación):
+      - base: -threshold_neg * std_neg y threshold_pos * std_pos
+      - si el menor * factor_comparison > el mayor => se unifican en el menor
+      - si no, el mayor se reduce a menor * weight_for_bigger
+    Acepta escalares o arrays de std (un valor por día).
+    Devuelve (usable_neg, usable_pos).
+    """
+    abs_neg = np.abs(-threshold_neg * np.asarray(std_neg, dtype=np.float64))
+    abs_pos = np.abs(threshold_pos * np.asarray(std_pos, dtype=np.float64))
+
+    threshold_smaller = np.minimum(abs_neg, abs_pos)
+    threshold_bigger  = np.maximum(abs_neg, abs_pos)
+    unificar = threshold_smaller * factor_comparison > threshold_bigger
+    neg_mayor = abs_neg > abs_pos
+
+    usable_neg = np.where(unificar, -threshold_smaller,
+                          np.where(neg_mayor, -threshold_smaller * weight_for_bigger, -abs_neg))
+    usable_pos = np.where(unificar, threshold_smaller,
+                          np.where(neg_mayor, abs_pos, threshold_smaller * weight_for_bigger))
+
+    if usable_neg.ndim == 0:
+        return float(usable_neg), float(usable_pos)
+    return usable_neg, usable_pos
+
+def pesos_excedencia(valores, usable_neg, usable_pos, std_neg, std_pos, k_neg, k_pos):
+    """
+    Peso de excedencia de cada muestra de CCMA (detection.py), vectorizado:
+      - val < usable_neg => max(0, |val / std_neg| - k_neg + 1)   (serie neg)
+      - si no, val > usable_pos => max(0, |val / std_pos| - k_pos + 1)  (serie pos)
+    Con std = 0 se usa n = 0, como en el bucle original.
+    Devuelve (pesos_neg, pesos_pos).
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    es_neg = valores < usable_neg
+    es_pos = (valores > usable_pos) & ~es_neg
+
+    n_neg = np.abs(valores / std_neg) if std_neg != 0 else np.zeros(len(valores))
+    n_pos = np.abs(valores / std_pos) if std_pos != 0 else np.zeros(len(valores))
+
+    pesos_neg = np.where(es_neg, np.maximum(0, n_neg - k_neg + 1), 0.0)
+    pesos_pos = np.where(es_pos, np.maximum(0, n_pos - k_pos + 1), 0.0)
+    return pesos_neg, pesos_pos
+
+def sumas_por_bloque(valores, muestras_bloque):
+    """
+    Suma de valores en bloques consecutivos de muestras_bloque (el último
+    puede quedar incompleto).
+    Devuelve (muestras de cada bloque, suma de cada bloque).
+
+    Se rellena con ceros hasta completar bloques y se usa np.cumsum por fila,
+    que suma en orden estricto: el resultado es idéntico bit a bit al
+    acumulador "+=" muestra a muestra del bucle original (np.add.reduceat
+    suma por pares y difiere en el último bit).
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    n_bloques = -(-len(valores) // muestras_bloque)
+    if n_bloques == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    bloques = np.zeros(n_bloques * muestras_bloque)
+    bloques[:len(valores)] = valores
+    sumas = np.cumsum(bloques.reshape(n_bloques, muestras_bloque), axis=1)[:, -1]
+
+    totales = np.full(n_bloques, muestras_bloque, dtype=np.int64)
+    totales[-1] = len(valores) - (n_bloques - 1) * muestras_bloque
+    return totales, sumas
+
+class SumaDeslizante:
+    """
+    Suma de los valores agregados en los últimos ventana_s segundos, con
+    costo O(1) amortizado por actualización sin importar el largo de la
+    ventana: cola con expiración por popleft y suma corriente.
+
+    Cuando en la ventana ya no queda ningún valor distinto de cero la suma
+    se fija en 0 exacto, para que el redondeo de sumar y restar no deje
+    residuos del orden de 1e-16 tras un evento.
+    """
+
+    def __init__(self, ventana_s):
+        self.ventana_s = ventana_s
+        self._cola = deque()
+        self._suma = 0.0
+        self._no_nulos = 0
+
+    def agregar(self, t, valor):
+        """Agrega valor con marca de tiempo t (datetime, en orden creciente)."""
+        self._cola.append((t, valor))
+        self._suma += valor
+        if valor != 0:
+            self._no_nulos += 1
+
+    def expirar(self, ahora):
+        """Descarta los valores con (ahora - t) > ventana_s."""
+        while self._cola and (ahora - self._cola[0][0]).total_seconds() > self.ventana_s:
+            _, valor = self._cola.popleft()
+            self._suma -= valor
+            if valor != 0:
+                self._no_nulos -= 1
+        if self._no_nulos == 0:
+            self._suma = 0.0
+
+    @property
+    def suma(self):
+        return self._suma
+
+def suma_ventana_dias(bloques, dias):
+    """
+    Versión en arrays de la ventana deslizante de detection.py.
+
+    bloques: matriz (n_días x bloques_por_día) de exceedances por bloque,
+             con ceros en los días sin datos.
+    Para el bloque b del día d suma los bloques de los días d - dias .. d - 1
+    y los bloques 0..b del día d (lo que la cola tiene en ese momento). Como
+    ese rango es contiguo en la matriz aplanada, sale de una suma acumulada.
+    Igual que SumaDeslizante, si en el rango no hay ningún bloque distinto
+    de cero la suma es 0 exacto.
+
+    Solo reproduce la cola en los días con datos de la estación: qué hace
+    detection.py en los demás días lo decide quien llama.
+    """
+    bloques = np.asarray(bloques, dtype=np.float64)
+    n_dias, por_dia = bloques.shape
+    S = np.zeros(bloques.size + 1)
+    np.cumsum(bloques.ravel(), out=S[1:])
+    N = np.zeros(bloques.size + 1, dtype=np.int64)
+    np.cumsum(bloques.ravel() != 0, out=N[1:])
+
+    i = np.arange(bloques.size)
+    l = np.maximum(0, (i // por_dia - dias) * por_dia)
+    sumas = np.where(N[i + 1] > N[l], S[i + 1] - S[l], 0.0)
+    return sumas.reshape(n_dias, por_dia)
+
+def tramos_activos(mascara):
+    """
+    Inicio y fin (índices incluidos) de cada tramo de valores True
+    consecutivos de la máscara, extraídos de los cambios de nivel.
+    """
+    bordes = np.diff(np.concatenate(([0], np.asarray(mascara, dtype=np.int8), [0])))
+    return np.flatnonzero(bordes == 1), np.flatnonzero(bordes == -1) - 1
+
+def rasterizar_intervalos(malla, intervalos):
+    """
+    Máscara booleana sobre la malla de tiempos (datetime64 ordenada) con True
+    en los instantes t que caen en algún intervalo cerrado ini <= t <= fin.
+
+    Cada intervalo se ubica con np.searchsorted y marca +1/-1 en sus bordes;
+    la suma acumulada da la máscara en O(T + I log T), sin recorrer los
+    intervalos por cada instante.
+    """
+    marcas = np.zeros(len(malla) + 1, dtype=np.int64)
+    if len(intervalos) == 0:
+        return marcas[:-1] > 0
+    ini = np.array([i for i, _ in intervalos], dtype=malla.dtype)
+    fin = np.array([f for _, f in intervalos], dtype=malla.dtype)
+    np.add.at(marcas, np.searchsorted(malla, ini, side="left"), 1)
+    np.add.at(marcas, np.searchsorted(malla, fin, side="right"), -1)
+    return np.cumsum(marcas[:-1]) > 0
@@ -1,8 +1,14 @@
 from obspy import read, UTCDateTime, Stream
 from scipy import signal
 import numpy as np
+import io
 import os
-import csv
+
+from almacen import exportar_csv_serie, guardar_serie_dia, leer_clas_dia
+from calculos import CLAS_B, cc_ventanas, segundos_validos
+from caches import CacheDias, CacheLRU
+from inventario import actualizar_inventario, archivos_dia, firma_dia, reporte_completitud
+from paralelo import mapear_con_precarga
 
 # ---------------------------------------------------
 # 1. PARÁMETROS COMUNES
@@ -21,6 +27,10 @@ fn_heads = [
     r"T:\Estaciones\PJIM",
 ]
 
+# Índice persistente de los archivos crudos de fn_heads (inventario.py): se
+# vuelve a listar un directorio solo cuando cambia su mtime
+ruta_inventario = r"T:\SSE\inventario_crudos.json"
+
 # ---------------------------------------------------
 # 2. PARÁMETROS DE FRECUENCIAS (LISTAS)
 #    Múltiples combinaciones HF/LF
@@ -51,11 +61,57 @@ dt_cc_list = [5, 5, 5, 5]
 min_twin_list = [180, 180, 180, 180]
 
 # ---------------------------------------------------
-# 4. BUCLE PRINCIPAL SOBRE COMBINACIONES DE FRECUENCIA
+# 3b. CACHÉ DE ENERGÍA HF
+#     hf_sq (suma de cuadrados HF a la tasa original) solo depende de la
+#     banda HF, así que se reutiliza entre combinaciones que la comparten.
+#     Un día a 100 Hz ocupa ~70 MB en float64; el límite acota la memoria.
+# ---------------------------------------------------
+hf_corners   = 2      # Orden del filtro HF
+hf_zerophase = True   # Filtro HF de fase cero
+hf_cache_max_mb = 300
+hf_cache = CacheLRU(hf_cache_max_mb * 1024**2)
+
+# La CC se guarda en un .npy anual float32 por estación (rejilla fija de dt_cc);
+# con True se escribe además el {date}.csv de texto de cada día
+cc_csv = False
+
+# ---------------------------------------------------
+# 3c. CACHÉ DE DÍAS DECODIFICADOS (opcional)
+#     Con un directorio, cada día válido se guarda como .npy + .json
+#     (caches.CacheDias) y las corridas siguientes lo cargan con mmap en vez
+#     de decodificar el miniSEED. None = sin caché.
+# ---------------------------------------------------
+cache_dias_dir = None  # p.ej. r"T:\SSE\cache_dias"
+cache_dias_max_gb = 50
+cache_dias = (
+    CacheDias(cache_dias_dir, cache_dias_max_gb * 1024**3) if cache_dias_dir else None
+)
+
+# ---------------------------------------------------
+# 3d. EJECUCIÓN EN PARALELO
+#     Procesos que atienden tareas (estación, día) a la vez; 1 = en serie.
+#     Cada worker devuelve la CC de sus combinaciones y el proceso principal
+#     es el único que escribe en los .npy anuales. Cada worker tiene su
+#     propia hf_cache (hasta hf_cache_max_mb).
 # ---------------------------------------------------
-for hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max in zip(
+n_workers = 1
+
+# Días leídos por adelantado (en un hilo, con su clasificación) mientras se
+# calcula el actual; acota la memoria a prefetch_dias + 2 días por proceso
+prefetch_dias = 1
+
+# ---------------------------------------------------
+# 4. COMBINACIONES DE FRECUENCIA Y DIRECTORIOS
+# ---------------------------------------------------
+# Cada día de cada estación se lee una sola vez y, con la misma señal en
+# memoria, se calcula la CC de todas las combinaciones HF/LF
+freq_combos = list(zip(
     hf_freq_min_list, hf_freq_max_list, lf_freq_min_list, lf_freq_max_list
-):
+))
+
+# (clas_dir, dir_out) por combinación
+dirs_combo = []
+for hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max in freq_combos:
     # Construye la ruta base según las frecuencias
     dir_base = os.path.join(
         r"T:\SSE",
@@ -67,195 +123,305 @@ for hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max in zip(
 
     # Directorio de salida para coeficiente de correlación
     dir_out = os.path.join(dir_base, "cc")
-    os.makedirs(dir_out, exist_ok=True)
-
-    print("======================================")
-    print(f"Correlación para combinación de frecuencias:")
-    print(f"  HF: {hf_freq_min}–{hf_freq_max} Hz | LF: {lf_freq_min}–{lf_freq_max} Hz")
-    print(f"  Dir. clasificación: {clas_dir}")
-    print(f"  Dir. salida (cc):  {dir_out}")
-    print("======================================")
-
-    # ---------------------------------------------------
-    # 5. BUCLE SOBRE ESTACIONES
-    # ---------------------------------------------------
-    for i_station, station in enumerate(stations):
-        dt       = dt_list[i_station]       # Intervalo de muestreo
-        dt_dec   = dt_dec_list[i_station]   # Paso de decimación
-        twin     = twin_list[i_station]     # Tamaño de la ventana (s)
-        dt_cc    = dt_cc_list[i_station]    # Intervalo para la CC final
-        min_twin = min_twin_list[i_station] # Tiempo mínimo válido (s)
-
-        # Con la ventana (twin) definimos ntwin en muestras decimadas
-        # ntwin = twin / dt_dec (porque tras decimar, el "nuevo dt" es dt_dec)
-        ntwin = int(twin / dt_dec)
-
-        # Definimos el filtro bandpass para hf_sq
-        # (fs = 1/dt) => sample rate original (antes de decimar).
-        b, a = signal.butter(2, [lf_freq_min, lf_freq_max], btype="bandpass", fs=int(1/dt))
-
-        # Creamos subcarpeta de salida para la estación
-        station_outdir = os.path.join(dir_out, station)
-        os.makedirs(station_outdir, exist_ok=True)
-
-        # -----------------------------------------------
-        # 5.1 Bucle de días
-        # -----------------------------------------------
-        day = startday
-        while day <= endday:
-            date_str = f"{day.year}{str(day.julday).zfill(3)}"
-            day += 86400  # Avanzar un día
-
-            # Archivo de clasificación
-            clas_file = os.path.join(clas_dir, f"{station}_{date_str}_clas.csv")
-            if not os.path.exists(clas_file):
-                print(f"[{station}] Clas. no encontrada para {date_str}.")
-                continue
+    dirs_combo.append((clas_dir, dir_out))
 
-            # Leemos la clasificación
-            with open(clas_file, 'r') as f:
-                reader = csv.reader(f)
-                class_data = [row[0] for row in reader]
-
-            # Cada fila del clasificador corresponde a un lapso
-            # (p.ej. 86400/1440=60s si es a 1-min en el script de RMS)
-            interval_seconds = 86400 / len(class_data)
-
-            # Leemos datos crudos (3 componentes)
-            st = Stream()
-            for component in components:
-                file_found = False
-                for fn_head in fn_heads:
-                    fn = os.path.join(fn_head, f"i4.{station}.{component}.{date_str}_0+")
-                    if os.path.exists(fn):
-                        try:
-                            st += read(fn)
-                            file_found = True
-                            break
-                        except Exception as e:
-                            continue
-                if not file_found:
-                    print(f"[{station}] Archivo {component} no encontrado para {date_str}.")
-
-            # Verificamos que haya 3 trazas
-            if len(st) < 3:
-                print(f"[{station}] Menos de 3 componentes en {date_str}.")
-                continue
-
-            # Verificamos longitud esperada (evitar días incompletos)
-            # Esperamos ~ 86400/dt muestras
-            expected_npts = int(86400 / dt)
-            # Permitimos cierto margen (±1/dt)
-            if any(abs(tr.stats.npts - expected_npts) > int(1/dt) for tr in st):
-                print(f"[{station}] Muestras no coinciden con lo esperado en {date_str}.")
-                continue
-
-            # Verificamos que todas las trazas tengan la misma npts
-            if any(st[0].stats.npts != tr.stats.npts for tr in st):
-                print(f"[{station}] Inconsistencia npts entre componentes en {date_str}.")
+# ---------------------------------------------------
+# 4b. VALIDACIÓN DE LOS DATOS CRUDOS
+# ---------------------------------------------------
+def leer_cabeceras(archivos):
+    """
+    Lee solo las cabeceras (read(headonly=True)) de cada componente, probando
+    las rutas en orden. Cada archivo se trae del disco una sola vez: sus
+    bytes quedan en memoria para decodificarlo después sin volver a leerlo.
+    Devuelve el Stream de cabeceras y {component: (ruta, bytes, firma)} de
+    las que se pudieron leer, con la firma del archivo tomada antes de leerlo.
+    """
+    st_cab = Stream()
+    crudos = {}
+    for component in components:
+        for fn in archivos[component]:
+            try:
+                firma_fn = firma_dia([fn])
+                with open(fn, "rb") as f:
+                    contenido = f.read()
+                st_cab += read(io.BytesIO(contenido), headonly=True)
+                crudos[component] = (fn, contenido, firma_fn)
+                break
+            except Exception as e:
                 continue
+    return st_cab, crudos
+
+def motivo_rechazo(st, dt):
+    """
+    Devuelve por qué se descarta el día (None si es válido). Solo usa
+    stats.npts, así que sirve igual con cabeceras que con datos decodificados.
+    """
+    # Verificamos que haya 3 trazas
+    if len(st) < 3:
+        return "Menos de 3 componentes"
+
+    # Verificamos longitud esperada (evitar días incompletos)
+    # Esperamos ~ 86400/dt muestras
+    expected_npts = int(86400 / dt)
+    # Permitimos cierto margen (±1/dt)
+    if any(abs(tr.stats.npts - expected_npts) > int(1/dt) for tr in st):
+        return "Muestras no coinciden con lo esperado"
+
+    # Verificamos que todas las trazas tengan la misma npts
+    if any(st[0].stats.npts != tr.stats.npts for tr in st):
+        return "Inconsistencia npts entre componentes"
+    return None
 
+# ---------------------------------------------------
+# 5. PROCESAMIENTO DE UN DÍA DE UNA ESTACIÓN
+#    leer_dia (E/S) corre en un hilo de fondo adelantado a calcular_dia
+# ---------------------------------------------------
+def leer_dia(tarea):
+    """
+    tarea = (i_station, day, archivos), con archivos = {component: [rutas]}
+    tomado del inventario. La firma para la caché de días se arma con un
+    os.stat de los archivos que efectivamente se leen.
+    Lee la clasificación de cada combinación y los datos crudos del día una
+    sola vez y devuelve (class_by_combo, st), o None si el día no se puede
+    procesar.
+    """
+    i_station, day, archivos = tarea
+    station = stations[i_station]
+    dt      = dt_list[i_station]
+
+    # -----------------------------------------------
+    # 5.1 Lectura del día
+    # -----------------------------------------------
+    date_str = f"{day.year}{str(day.julday).zfill(3)}"
+    year, julday = day.year, day.julday
+
+    # Leemos la clasificación de cada combinación desde el .npy anual
+    # (códigos uint8 de calculos.CLASES; None si el día no existe)
+    class_by_combo = []
+    for clas_dir, _ in dirs_combo:
+        class_data = leer_clas_dia(clas_dir, station, year, julday)
+        if class_data is not None:
+            class_data = np.array(class_data)  # se copia aquí, en la lectura
+        else:
+            print(f"[{station}] Clas. no encontrada para {date_str} en {clas_dir}.")
+        class_by_combo.append(class_data)
+
+    # Si ninguna combinación tiene clasificación, no vale la pena leer datos
+    if all(class_data is None for class_data in class_by_combo):
+        return None
+
+    # Datos ya decodificados de la caché de días, si está vigente
+    st = cache_dias.get(station, date_str) if cache_dias is not None else None
+    desde_cache = st is not None
+    if not desde_cache:
+        # Pre-validación con las cabeceras (read headonly, sin decodificar Steim):
+        # los días que se rechazarían no se llegan a decodificar
+        st_cab, crudos = leer_cabeceras(archivos)
+        for component in components:
+            if component not in crudos:
+                print(f"[{station}] Archivo {component} no encontrado para {date_str}.")
+        motivo = motivo_rechazo(st_cab, dt)
+        if motivo:
+            print(f"[{station}] {motivo} en {date_str}.")
+            return None
+
+        # Decodificamos los datos crudos (3 componentes) desde los bytes ya
+        # leídos, una sola vez para todas las combinaciones
+        st = Stream()
+        firma = [archivo for _, _, firma_fn in crudos.values() for archivo in firma_fn]
+        for component, (fn, contenido, _) in crudos.items():
+            try:
+                st += read(io.BytesIO(contenido))
+            except Exception as e:
+                print(f"[{station}] No se pudo leer {fn}.")
+
+    # Se repiten las verificaciones sobre los datos decodificados
+    motivo = motivo_rechazo(st, dt)
+    if motivo:
+        print(f"[{station}] {motivo} en {date_str}.")
+        return None
+
+    if cache_dias is not None and not desde_cache:
+        cache_dias.put(station, date_str, firma, st)
+    return class_by_combo, st
+
+def calcular_dia(tarea, datos):
+    """
+    Con lo leído por leer_dia calcula la CC y devuelve (i_station, year,
+    julday, CC por combinación), con None en las combinaciones sin
+    clasificación, o None en lugar de la lista si el día no se pudo leer.
+    """
+    i_station, day, _ = tarea
+    year, julday = day.year, day.julday
+    if datos is None:
+        return i_station, year, julday, None
+    class_by_combo, st = datos
+    date_str = f"{year}{str(julday).zfill(3)}"
+
+    station  = stations[i_station]
+    dt       = dt_list[i_station]       # Intervalo de muestreo
+    dt_dec   = dt_dec_list[i_station]   # Paso de decimación
+    twin     = twin_list[i_station]     # Tamaño de la ventana (s)
+    dt_cc    = dt_cc_list[i_station]    # Intervalo para la CC final
+    min_twin = min_twin_list[i_station] # Tiempo mínimo válido (s)
+
+    # Con la ventana (twin) definimos ntwin en muestras decimadas
+    # ntwin = twin / dt_dec (porque tras decimar, el "nuevo dt" es dt_dec)
+    ntwin = int(twin / dt_dec)
+
+    # Definimos el filtro bandpass para hf_sq de cada combinación
+    # (fs = 1/dt) => sample rate original (antes de decimar).
+    filtros_ba = [
+        signal.butter(2, [lf_freq_min, lf_freq_max], btype="bandpass", fs=int(1/dt))
+        for _, _, lf_freq_min, lf_freq_max in freq_combos
+    ]
+
+    # Subcarpeta de salida de la estación en cada combinación
+    station_outdirs = [os.path.join(dir_out, station) for _, dir_out in dirs_combo]
+
+    # -----------------------------------------------
+    # 5.2 Bucle sobre combinaciones (mismo día en memoria)
+    # -----------------------------------------------
+    cc_by_combo = []
+    for i_combo, (hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max) in enumerate(freq_combos):
+        class_data = class_by_combo[i_combo]
+        if class_data is None:
+            cc_by_combo.append(None)
+            continue
+        b, a = filtros_ba[i_combo]
+        station_outdir = station_outdirs[i_combo]
+
+        # Cada fila del clasificador corresponde a un lapso
+        # (p.ej. 86400/1440=60s si es a 1-min en el script de RMS)
+        interval_seconds = 86400 / len(class_data)
+
+        # Energía HF: se reutiliza si otra combinación ya filtró esta banda
+        hf_key = (station, date_str, hf_freq_min, hf_freq_max, hf_corners, hf_zerophase)
+        hf_sq = hf_cache.get(hf_key)
+        if hf_sq is None:
             # Filtrado HF (2–8 Hz, etc.)
             st_hf = st.copy().filter(
                 type="bandpass",
                 freqmin=hf_freq_min,
                 freqmax=hf_freq_max,
-                corners=2,
-                zerophase=True
+                corners=hf_corners,
+                zerophase=hf_zerophase
             )
             # Sumamos potencias HF en las 3 componentes
             hf_sq = np.sum([tr.data**2 for tr in st_hf], axis=0)
-            # Filtro bandpass en hf_sq (usando banda LF para "envelope")
-            hf_sq_bp = signal.filtfilt(b, a, hf_sq)
-
-            # Filtrado LF (0.02–0.05, etc.),
-            # luego integrar y detrend
-            st_lf = (
-                st.copy()
-                  .detrend("linear")
-                  .filter(type="bandpass", freqmin=lf_freq_min, freqmax=lf_freq_max, corners=2, zerophase=True)
-                  .integrate()
-                  .detrend("linear")
-            )
-            # Tomamos la traza vertical (o la primera en st_lf)
-            lf = st_lf[0].data
-
-            # Decimamos hf_sq_bp y lf
-            # ratio = round(dt_dec / dt) => factor en muestras
-            dec_factor = int(round(dt_dec / dt))
-            hf_sq_bp = signal.decimate(hf_sq_bp, dec_factor)
-            lf       = signal.decimate(lf, dec_factor)
-
-            # Limpieza de posibles NaNs
-            hf_sq_bp = np.nan_to_num(hf_sq_bp, nan=0.0, posinf=0.0, neginf=0.0)
-            lf       = np.nan_to_num(lf,       nan=0.0, posinf=0.0, neginf=0.0)
-
-            # Serie de tiempo en la resolución dt_cc
-            # time_cc -> [0, dt_cc, 2*dt_cc, ...  < 86400]
-            time_cc = np.arange(0, 86400, dt_cc)
-
-            # Array para la CC
-            cc = np.zeros(len(time_cc))
-
-            # Recorremos en pasos de dt_cc para calcular CC en cada ventana
-            # i va en índices de time_cc (0,1,2,...)
-            # ntwin = int(twin / dt_dec) (ya calculado arriba)
-            half_ntwin = ntwin // 2
-
-            for i in range(len(time_cc)):
-                # Posición (i_wave) en la señal decimada
-                i_wave = int(time_cc[i] / dt_dec)  # (s) / (s) => muestras en data decimada
-                i_wave_l = i_wave - half_ntwin
-                i_wave_r = i_wave + half_ntwin
-
-                # Contamos cuántos segundos "b" hay en la clasificación dentro de la ventana
-                valid_count = 0
-                for k in range(-half_ntwin, half_ntwin):
-                    idx_dec = i_wave + k
-                    if idx_dec < 0 or idx_dec >= len(hf_sq_bp):
-                        continue
-
-                    # Convertir idx_dec a tiempo real en segundos (respecto al día)
-                    time_in_seconds = time_cc[i] + (k * dt_dec)
-                    if time_in_seconds < 0 or time_in_seconds >= 86400:
-                        continue
-
-                    # Indice en class_data
-                    class_index = int(time_in_seconds // interval_seconds)
-                    if class_index < 0 or class_index >= len(class_data):
-                        continue
-
-                    if class_data[class_index] == "b":
-                        valid_count += dt_dec  # (s)
-
-                # Verificar si tenemos min_twin s de datos "b"
-                if valid_count < min_twin:
-                    cc[i] = 0
-                    continue
-
-                # Comprobamos que la ventana [i_wave_l, i_wave_r] esté dentro de hf_sq_bp
-                if i_wave_l < 0 or i_wave_r > len(hf_sq_bp):
-                    cc[i] = 0
-                    continue
-
-                # Calculamos CC
-                a1 = hf_sq_bp[i_wave_l:i_wave_r] - np.mean(hf_sq_bp[i_wave_l:i_wave_r])
-                a2 = lf[i_wave_l:i_wave_r]       - np.mean(lf[i_wave_l:i_wave_r])
-
-                norm_a1 = np.linalg.norm(a1, ord=2)
-                norm_a2 = np.linalg.norm(a2, ord=2)
-                if norm_a1 == 0 or norm_a2 == 0:
-                    cc[i] = 0
-                else:
-                    cc[i] = np.dot(a1, a2) / (norm_a1 * norm_a2)
-
-            # Guardamos la CC en un archivo CSV
+            hf_cache.put(hf_key, hf_sq)
+        # Filtro bandpass en hf_sq (usando banda LF para "envelope")
+        hf_sq_bp = signal.filtfilt(b, a, hf_sq)
+
+        # Filtrado LF (0.02–0.05, etc.),
+        # luego integrar y detrend
+        st_lf = (
+            st.copy()
+              .detrend("linear")
+              .filter(type="bandpass", freqmin=lf_freq_min, freqmax=lf_freq_max, corners=2, zerophase=True)
+              .integrate()
+              .detrend("linear")
+        )
+        # Tomamos la traza vertical (o la primera en st_lf)
+        lf = st_lf[0].data
+
+        # Decimamos hf_sq_bp y lf
+        # ratio = round(dt_dec / dt) => factor en muestras
+        dec_factor = int(round(dt_dec / dt))
+        hf_sq_bp = signal.decimate(hf_sq_bp, dec_factor)
+        lf       = signal.decimate(lf, dec_factor)
+
+        # Limpieza de posibles NaNs
+        hf_sq_bp = np.nan_to_num(hf_sq_bp, nan=0.0, posinf=0.0, neginf=0.0)
+        lf       = np.nan_to_num(lf,       nan=0.0, posinf=0.0, neginf=0.0)
+
+        # Serie de tiempo en la resolución dt_cc
+        # time_cc -> [0, dt_cc, 2*dt_cc, ...  < 86400]
+        time_cc = np.arange(0, 86400, dt_cc)
+
+        # Recorremos en pasos de dt_cc para calcular CC en cada ventana
+        # i va en índices de time_cc (0,1,2,...)
+        # ntwin = int(twin / dt_dec) (ya calculado arriba)
+        half_ntwin = ntwin // 2
+
+        # Posición (i_wave) de cada centro de ventana en la señal decimada
+        i_wave_all = (time_cc / dt_dec).astype(int)
+
+        # CC de todas las ventanas en una sola pasada (sumas por ventana);
+        # las ventanas fuera de hf_sq_bp o con norma nula quedan en 0
+        cc = cc_ventanas(hf_sq_bp, lf, i_wave_all, half_ntwin)
+
+        # Segundos "b" de la clasificación dentro de cada ventana
+        # (máscara expandida a la tasa decimada + suma acumulada)
+        valid_count = segundos_validos(
+            class_data == CLAS_B, interval_seconds,
+            time_cc, dt_dec, len(hf_sq_bp), half_ntwin
+        )
+
+        # Sin min_twin s de datos "b" => CC = 0
+        cc[valid_count < min_twin] = 0
+
+        # El .npy anual ({dir_out}/{station}/{año}.npy) lo escribe el proceso principal
+        cc_by_combo.append(cc)
+
+        # Copia en CSV solo si se pide para inspección
+        if cc_csv:
             output_file = os.path.join(station_outdir, f"{date_str}.csv")
-            with open(output_file, mode='w', newline='') as csvfile:
-                csvwriter = csv.writer(csvfile)
-                csvwriter.writerow(['Time (s)', 'CC Value'])
-                csvwriter.writerows(zip(time_cc, cc))
-
-        # Fin while day
-    # Fin bucle estaciones
-# Fin bucle combinaciones HF/LF
+            exportar_csv_serie(output_file, cc, dt_cc, ['Time (s)', 'CC Value'])
+
+    # La energía HF solo se reutiliza dentro del mismo día
+    hf_cache.clear()
+    return i_station, year, julday, cc_by_combo
+
+# ---------------------------------------------------
+# 6. BUCLE SOBRE ESTACIONES Y DÍAS
+# ---------------------------------------------------
+if __name__ == "__main__":
+    for (hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max), (clas_dir, dir_out) in zip(
+        freq_combos, dirs_combo
+    ):
+        print("======================================")
+        print(f"Correlación para combinación de frecuencias:")
+        print(f"  HF: {hf_freq_min}–{hf_freq_max} Hz | LF: {lf_freq_min}–{lf_freq_max} Hz")
+        print(f"  Dir. clasificación: {clas_dir}")
+        print(f"  Dir. salida (cc):  {dir_out}")
+        print("======================================")
+
+        # Creamos subcarpeta de salida para cada estación
+        for station in stations:
+            os.makedirs(os.path.join(dir_out, station), exist_ok=True)
+
+    # Inventario de archivos crudos y días con las 3 componentes
+    dias = []
+    day = startday
+    while day <= endday:
+        dias.append(day)
+        day += 86400  # Avanzar un día
+    fechas = [f"{d.year}{str(d.julday).zfill(3)}" for d in dias]
+    inventario = actualizar_inventario(fn_heads, ruta_inventario, fechas=fechas)
+    completos = reporte_completitud(inventario, stations, components, fechas)
+
+    # Una tarea por estación y día completo (los incompletos ya se reportaron)
+    tareas = []
+    for i_station, station in enumerate(stations):
+        for day in dias:
+            date_str = f"{day.year}{str(day.julday).zfill(3)}"
+            if date_str in completos[station]:
+                tareas.append((
+                    i_station, day,
+                    archivos_dia(inventario, station, components, date_str)
+                ))
+
+    # Los resultados llegan en el orden de las tareas, igual que en serie
+    for i_station, year, julday, cc_by_combo in mapear_con_precarga(
+        leer_dia, calcular_dia, tareas, n_workers, prefetch_dias
+    ):
+        if cc_by_combo is None:
+            continue
+        for (_, dir_out), cc in zip(dirs_combo, cc_by_combo):
+            if cc is None:
+                continue
+            # Guardamos la CC en el archivo anual binario ({dir_out}/{station}/{año}.npy)
+            guardar_serie_dia(dir_out, stations[i_station], year, julday, cc)
+
+# Fin bucle estaciones
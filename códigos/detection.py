@@ -3,7 +3,10 @@ import csv
 from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
 from obspy import UTCDateTime
-from collections import deque
+import numpy as np
+
+from almacen import leer_serie_dia
+from calculos import SumaDeslizante, pesos_excedencia, sumas_por_bloque, umbrales_utilizables
 
 #--------------------------------------------------------------------
 # 1. Parámetros de entrada
@@ -83,9 +86,10 @@ probabilities_neg = {st: [] for st in stations}
 probabilities_pos = {st: [] for st in stations}
 time_axis = []
 
-# Cada estación lleva una cola con la data (tiempo, exceedances, total_muestras)
-data_queues_neg = {st: deque() for st in stations}
-data_queues_pos = {st: deque() for st in stations}
+# Cada estación lleva una suma deslizante de exceedances sobre la ventana
+# de "days" días (cola con expiración y suma corriente, O(1) por bloque)
+data_queues_neg = {st: SumaDeslizante(window_seconds) for st in stations}
+data_queues_pos = {st: SumaDeslizante(window_seconds) for st in stations}
 
 #--------------------------------------------------------------------
 # Función auxiliar: cuántas muestras hacen "N horas"
@@ -104,8 +108,9 @@ while current_day <= endday:
 
     # Para cada estación
     for station in stations:
-        file_path = os.path.join(input_dir, station, f"{date_str}.csv")
-        if not os.path.exists(file_path):
+        # Datos CCMA del día desde el .npy anual de la estación (sin parseo)
+        ccma_day = leer_serie_dia(input_dir, station, current_day.year, current_day.julday)
+        if ccma_day is None:
             continue
 
         data_found_for_day = True
@@ -117,105 +122,37 @@ while current_day <= endday:
             day_std_neg = 0.0
             day_std_pos = 0.0
 
-        # Leer datos CCMA
-        all_times = []
-        all_values = []
-        with open(file_path, 'r', newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            header = next(reader, None)  # ["Time (s)", "CC Value"]
-            for row in reader:
-                t_s = float(row[0])
-                val = float(row[1])
-                all_times.append(t_s)
-                all_values.append(val)
-
-        if not all_times:
+        all_values = np.asarray(ccma_day, dtype=np.float64)
+        if len(all_values) == 0:
             continue
 
-        # Calcular tasa de muestreo
-        if len(all_times) >= 2:
-            sampling_interval_s = all_times[1] - all_times[0]
-            if sampling_interval_s <= 0:
-                sampling_interval_s = 1.0
-        else:
-            sampling_interval_s = 1.0
+        # Rejilla fija: la tasa de muestreo sale del número de muestras por día
+        sampling_interval_s = 86400 / len(all_values)
 
         # Bloques de 2 horas
         samples_per_block = muestras_por_bloque(sampling_interval_s, interval_hours)
 
-        # Acumuladores para cada bloque
-        current_block_data = []
-        current_exceedances_neg = 0.0
-        current_exceedances_pos = 0.0
-
-        hourly_total           = []
-        hourly_exceedances_neg = []
-        hourly_exceedances_pos = []
-
         #-----------------------------------------------------------
         # Umbrales diario (con posible unificación)
         #-----------------------------------------------------------
-        base_threshold_neg = -threshold_neg * day_std_neg  # e.g. -4 * std_neg
-        base_threshold_pos =  threshold_pos * day_std_pos  # e.g.  4 * std_pos
-
-        abs_neg = abs(base_threshold_neg)
-        abs_pos = abs(base_threshold_pos)
-
-        threshold_smaller = min(abs_neg, abs_pos)
-        threshold_bigger  = max(abs_neg, abs_pos)
-
-        # Revisar si se "unifica"
-        if threshold_smaller * factor_comparison > threshold_bigger:
-            # Parecidos => unificar
-            day_unified = threshold_smaller
-            usable_neg = -day_unified
-            usable_pos =  day_unified
-        else:
-            # Distintos => reducir el grande
-            if abs_neg > abs_pos:
-                abs_neg = threshold_smaller * weight_for_bigger
-            else:
-                abs_pos = threshold_smaller * weight_for_bigger
-            usable_neg = -abs_neg
-            usable_pos =  abs_pos
+        usable_neg, usable_pos = umbrales_utilizables(
+            day_std_neg, day_std_pos,
+            threshold_neg, threshold_pos,      # e.g. -4 * std_neg, 4 * std_pos
+            factor_comparison, weight_for_bigger
+        )
 
         #--------------------------------------------------------------------
-        # 6. Recorrer las muestras del día y calcular "exceedances" 
-        #    (MISMA LÓGICA DEL ORIGINAL, sin probabilidades)
+        # 6. Calcular "exceedances" de todas las muestras del día a la vez
+        #    (MISMA LÓGICA DEL ORIGINAL, sin probabilidades) y sumarlas
+        #    por bloques de 2 horas (el último puede quedar incompleto)
         #--------------------------------------------------------------------
-        for val in all_values:
-            current_block_data.append(val)
-
-            # Chequear excedencia NEG
-            if val < usable_neg:
-                n_neg = abs(val / day_std_neg) if day_std_neg != 0 else 0
-                k_neg = threshold_neg  # (4)
-                # == LÓGICA ORIGINAL ==
-                current_exceedances_neg += max(0, (n_neg - k_neg + 1)**1)
-
-            # Chequear excedencia POS
-            elif val > usable_pos:
-                n_pos = abs(val / day_std_pos) if day_std_pos != 0 else 0
-                k_pos = threshold_pos  # (4)
-                # == LÓGICA ORIGINAL ==
-                current_exceedances_pos += max(0, (n_pos - k_pos + 1)**1)
-
-            # Cuando completamos el bloque
-            if len(current_block_data) == samples_per_block:
-                hourly_total.append(len(current_block_data))
-                hourly_exceedances_neg.append(current_exceedances_neg)
-                hourly_exceedances_pos.append(current_exceedances_pos)
-
-                # Reset
-                current_block_data = []
-                current_exceedances_neg = 0.0
-                current_exceedances_pos = 0.0
-
-        # Bloque incompleto
-        if current_block_data:
-            hourly_total.append(len(current_block_data))
-            hourly_exceedances_neg.append(current_exceedances_neg)
-            hourly_exceedances_pos.append(current_exceedances_pos)
+        pesos_neg, pesos_pos = pesos_excedencia(
+            all_values, usable_neg, usable_pos,
+            day_std_neg, day_std_pos,
+            threshold_neg, threshold_pos  # k_neg, k_pos (4)
+        )
+        hourly_total, hourly_exceedances_neg = sumas_por_bloque(pesos_neg, samples_per_block)
+        _,            hourly_exceedances_pos = sumas_por_bloque(pesos_pos, samples_per_block)
 
         #--------------------------------------------------------------------
         # 7. Actualizar colas y convertir excedances a HORAS
@@ -225,14 +162,10 @@ while current_day <= endday:
                                                          hourly_exceedances_neg,
                                                          hourly_exceedances_pos):
 
-            # NEG:
-            data_queues_neg[station].append((current_day.datetime, exceed_neg_val, total))
-            # Descartar datos fuera de la ventana
-            data_queues_neg[station] = deque(
-                (t, e, v) for (t, e, v) in data_queues_neg[station]
-                if (current_day.datetime - t).total_seconds() <= window_seconds
-            )
-            total_exceedances_neg = sum(item[1] for item in data_queues_neg[station])
+            # NEG: agregar el bloque y descartar datos fuera de la ventana
+            data_queues_neg[station].agregar(current_day.datetime, exceed_neg_val)
+            data_queues_neg[station].expirar(current_day.datetime)
+            total_exceedances_neg = data_queues_neg[station].suma
 
             # === AQUÍ LA DIFERENCIA ===
             # Se multiplica por sampling_interval_s y se divide entre 3600 
@@ -242,12 +175,9 @@ while current_day <= endday:
             probabilities_neg[station].append(tiempo_acumulado_neg)
 
             # POS:
-            data_queues_pos[station].append((current_day.datetime, exceed_pos_val, total))
-            data_queues_pos[station] = deque(
-                (t, e, v) for (t, e, v) in data_queues_pos[station]
-                if (current_day.datetime - t).total_seconds() <= window_seconds
-            )
-            total_exceedances_pos = sum(item[1] for item in data_queues_pos[station])
+            data_queues_pos[station].agregar(current_day.datetime, exceed_pos_val)
+            data_queues_pos[station].expirar(current_day.datetime)
+            total_exceedances_pos = data_queues_pos[station].suma
 
             tiempo_acumulado_pos = (total_exceedances_pos * sampling_interval_s) / 3600.0
 
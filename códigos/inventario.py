@@ -0,0 +1,145 @@
+import os
+import re
+import json
+
+# --------------------------------------------------------------------------------
+# Inventario de los archivos crudos i4.{station}.{component}.{YYYYDDD}_0+
+#   Un solo listado (os.scandir) por directorio de fn_heads en vez de un
+#   os.path.exists por (estación, componente, día, directorio). El índice se
+#   guarda en JSON y solo se vuelve a listar un directorio cuando cambia su
+#   mtime (se agregaron o borraron archivos).
+#   Cada archivo queda con su tamaño y mtime, que sirven para invalidar lo
+#   que se haya derivado de él. Reescribir un archivo en su lugar no cambia
+#   el mtime del directorio, así que los archivos de los días pedidos se
+#   vuelven a consultar (os.stat) en cada corrida.
+# --------------------------------------------------------------------------------
+PATRON_CRUDO = re.compile(r"^i4\.([^.]+)\.([^.]+)\.(\d{7})_0\+$")
+
+def _listar_directorio(fn_head):
+    """{nombre: [size, mtime]} de los archivos crudos de un directorio."""
+    archivos = {}
+    with os.scandir(fn_head) as entradas:
+        for entrada in entradas:
+            if not PATRON_CRUDO.match(entrada.name) or not entrada.is_file():
+                continue
+            info = entrada.stat()
+            archivos[entrada.name] = [info.st_size, info.st_mtime]
+    return archivos
+
+def _reconsultar_archivos(fn_head, archivos, fechas):
+    """
+    Actualiza en archivos ({nombre: [size, mtime]}) el tamaño y mtime de los
+    archivos de los días de fechas, y quita los que ya no existen.
+    Devuelve True si algo cambió.
+    """
+    cambios = False
+    for nombre in list(archivos):
+        if PATRON_CRUDO.match(nombre).group(3) not in fechas:
+            continue
+        try:
+            info = os.stat(os.path.join(fn_head, nombre))
+        except FileNotFoundError:
+            del archivos[nombre]
+            cambios = True
+            continue
+        actual = [info.st_size, info.st_mtime]
+        if archivos[nombre] != actual:
+            archivos[nombre] = actual
+            cambios = True
+    return cambios
+
+def actualizar_inventario(fn_heads, ruta_indice, forzar=False, fechas=None):
+    """
+    Carga el índice de ruta_indice y vuelve a listar los directorios de
+    fn_heads que no estaban o cuyo mtime cambió (todos si forzar=True).
+    En los demás directorios se vuelven a consultar el tamaño y mtime de los
+    archivos de los días de fechas (lista de 'YYYYDDD'), para notar los que
+    se reescribieron en su lugar.
+    Guarda el índice (vía temporal + os.replace) si hubo cambios.
+
+    Devuelve {(station, component, date): [(ruta, size, mtime), ...]} con las
+    rutas en el orden de fn_heads, el mismo en que se probaban antes.
+    """
+    indice = {}
+    if os.path.exists(ruta_indice) and not forzar:
+        with open(ruta_indice, "r") as f:
+            indice = json.load(f)
+
+    fechas = set(fechas or ())
+    cambios = False
+    for fn_head in fn_heads:
+        if not os.path.isdir(fn_head):
+            print(f"Directorio de datos no disponible: {fn_head}")
+            continue
+        mtime_dir = os.stat(fn_head).st_mtime
+        guardado = indice.get(fn_head)
+        if guardado is None or guardado["mtime"] != mtime_dir:
+            indice[fn_head] = {"mtime": mtime_dir, "archivos": _listar_directorio(fn_head)}
+            cambios = True
+        elif fechas and _reconsultar_archivos(fn_head, guardado["archivos"], fechas):
+            cambios = True
+
+    if cambios:
+        os.makedirs(os.path.dirname(ruta_indice) or ".", exist_ok=True)
+        tmp = ruta_indice + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(indice, f)
+        os.replace(tmp, ruta_indice)
+
+    inventario = {}
+    for fn_head in fn_heads:
+        if fn_head not in indice:
+            continue
+        for nombre, (size, mtime) in indice[fn_head]["archivos"].items():
+            station, component, date = PATRON_CRUDO.match(nombre).groups()
+            inventario.setdefault((station, component, date), []).append(
+                (os.path.join(fn_head, nombre), size, mtime)
+            )
+    return inventario
+
+def archivos_dia(inventario, station, components, date):
+    """{component: [rutas en orden de fn_heads]} de un día (lista vacía si falta)."""
+    return {
+        component: [ruta for ruta, _, _ in inventario.get((station, component, date), [])]
+        for component in components
+    }
+
+def firma_dia(rutas):
+    """
+    Lista [(ruta, size, mtime), ...] de los archivos crudos dados (los que
+    efectivamente se leyeron), con un os.stat actual de cada uno y no con lo
+    guardado en el índice: si alguno cambia, cambia la firma y se invalida
+    lo derivado de él. Los que ya no existen se omiten.
+    """
+    firma = []
+    for ruta in rutas:
+        try:
+            info = os.stat(ruta)
+        except FileNotFoundError:
+            continue
+        firma.append((ruta, info.st_size, info.st_mtime))
+    return firma
+
+def reporte_completitud(inventario, stations, components, fechas):
+    """
+    Imprime por estación cuántos días de fechas (lista de 'YYYYDDD') tienen
+    todas las componentes y cuáles no, y devuelve {station: set de días
+    completos}.
+    """
+    completos = {}
+    print("======================================")
+    print(f"Inventario: {len(fechas)} días, componentes {'/'.join(components)}")
+    for station in stations:
+        completos[station] = set()
+        incompletos = []
+        for date in fechas:
+            faltan = [c for c in components if (station, c, date) not in inventario]
+            if faltan:
+                incompletos.append(f"{date}(-{','.join(faltan)})")
+            else:
+                completos[station].add(date)
+        print(f"  {station}: {len(completos[station])}/{len(fechas)} días completos")
+        if incompletos:
+            print(f"    incompletos: {' '.join(incompletos)}")
+    print("======================================")
+    return completos
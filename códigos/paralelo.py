@@ -0,0 +1,104 @@
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# --------------------------------------------------------------------------------
+# Ejecución de tareas independientes (estación, día) en un pool de procesos
+# --------------------------------------------------------------------------------
+
+def mapear_tareas(funcion, tareas, n_workers=1):
+    """
+    Aplica funcion a cada tarea y entrega los resultados en el orden de
+    tareas, de modo que quien los recibe los escribe siempre igual que en
+    serie.
+
+    Con n_workers=1 todo corre en este proceso (sin pool). Con más se usa un
+    ProcessPoolExecutor: funcion y las tareas deben poder serializarse
+    (funciones de nivel de módulo) y el script que llama debe proteger su
+    bucle principal con `if __name__ == "__main__":` (en Windows cada worker
+    vuelve a importar el módulo).
+    """
+    if n_workers == 1:
+        for tarea in tareas:
+            yield funcion(tarea)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        for resultado in pool.map(funcion, tareas):
+            yield resultado
+
+# --------------------------------------------------------------------------------
+# Precarga: lectura del día siguiente en un hilo mientras se calcula el actual
+# --------------------------------------------------------------------------------
+_FIN = object()
+
+def precargar(leer, tareas, en_vuelo=1):
+    """
+    Entrega (tarea, leer(tarea)) en orden, con leer corriendo en un hilo de
+    fondo que deja los datos en una cola de en_vuelo lugares. Cuando la cola
+    está llena el hilo espera (contrapresión): en memoria hay a lo sumo
+    en_vuelo días en la cola, uno leyéndose y el que se está calculando.
+    Un error de leer se vuelve a lanzar en quien consume.
+    """
+    cola = queue.Queue(maxsize=en_vuelo)
+    parar = threading.Event()
+
+    def poner(elemento):
+        # put con espera corta para poder abandonar si el consumidor se fue
+        while not parar.is_set():
+            try:
+                cola.put(elemento, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def productor():
+        try:
+            for tarea in tareas:
+                if not poner((tarea, leer(tarea))):
+                    return
+        except BaseException as e:
+            poner((_FIN, e))
+            return
+        poner((_FIN, None))
+
+    hilo = threading.Thread(target=productor, daemon=True)
+    hilo.start()
+    try:
+        while True:
+            tarea, datos = cola.get()
+            if tarea is _FIN:
+                if datos is not None:
+                    raise datos
+                return
+            yield tarea, datos
+    finally:
+        parar.set()
+        hilo.join()
+
+def _procesar_lote(leer, calcular, en_vuelo, lote):
+    """Procesa un lote de tareas en un worker, con precarga del día siguiente."""
+    return [calcular(tarea, datos) for tarea, datos in precargar(leer, lote, en_vuelo)]
+
+def mapear_con_precarga(leer, calcular, tareas, n_workers=1, en_vuelo=1):
+    """
+    Como mapear_tareas(funcion) con funcion(t) = calcular(t, leer(t)), pero
+    leyendo la tarea siguiente mientras se calcula la actual (precargar).
+
+    En serie los resultados salen uno a uno. Con pool, cada worker recibe
+    lotes de tareas consecutivas (unos 4 lotes por worker) y precarga dentro
+    de su lote; los resultados siguen en el orden de tareas.
+    """
+    if n_workers == 1:
+        for tarea, datos in precargar(leer, tareas, en_vuelo):
+            yield calcular(tarea, datos)
+        return
+
+    tareas = list(tareas)
+    tam = max(1, -(-len(tareas) // (n_workers * 4)))
+    lotes = [tareas[i:i + tam] for i in range(0, len(tareas), tam)]
+    funcion = partial(_procesar_lote, leer, calcular, en_vuelo)
+    for resultados in mapear_tareas(funcion, lotes, n_workers):
+        yield from resultados
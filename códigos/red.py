@@ -2,10 +2,14 @@ import os
 import csv
 import math
 import itertools
-from datetime import datetime, timedelta
+from datetime import datetime
+import numpy as np
 import matplotlib.pyplot as plt
 from obspy import UTCDateTime
 
+from almacen import leer_presencia_bloques, malla_bloques
+from calculos import tramos_activos
+
 # --------------------------------------------------------------------------
 # 1. Parámetros principales
 # --------------------------------------------------------------------------
@@ -49,10 +53,6 @@ all_sse_events = sse_events1 + sse_events2
 # --------------------------------------------------------------------------
 # 2. Funciones auxiliares
 # --------------------------------------------------------------------------
-def parse_iso_to_dt(timestr: str) -> datetime:
-    """Convierte 'YYYY-MM-DDTHH:MM:SS' a datetime."""
-    return datetime.fromisoformat(timestr)
-
 def overlaps(event_start, event_end, global_start, global_end):
     """Verifica si [event_start, event_end] se traslapa con [global_start, global_end]."""
     return not (event_end < global_start or event_start > global_end)
@@ -75,13 +75,60 @@ def format_duration(delta_sec: float) -> str:
         parts = ["0s"]
     return " ".join(parts)
 
-def get_combinations(stations_list, min_size):
-    """Genera todas las combinaciones de stations_list con longitud >= min_size."""
-    results = []
+def rango_combinacion(idx, n):
+    """
+    Posición de la combinación idx (índices crecientes de range(n)) entre
+    todas las de su tamaño en el orden de itertools.combinations, sin
+    generarlas: por cada posición se cuentan las combinaciones que empiezan
+    con un índice menor.
+    """
+    k = len(idx)
+    rango = 0
+    previo = -1
+    for j, i in enumerate(idx):
+        for v in range(previo + 1, i):
+            rango += math.comb(n - 1 - v, k - 1 - j)
+        previo = i
+    return rango
+
+def subredes_con_detecciones(stations_list, min_size, bits_por_estacion):
+    """
+    Recorre el retículo de subcombinaciones de stations_list por niveles
+    (tamaño 1, 2, ...) y devuelve [(combo, bits comunes)] de las que tienen
+    longitud >= min_size y al menos un bloque en común, en el mismo orden
+    que itertools.combinations por tamaño.
+
+    Poda tipo Apriori: si una subcombinación no tiene detecciones comunes,
+    ninguna que la contenga puede tenerlas. Un candidato de tamaño k solo se
+    evalúa si todos sus subconjuntos de tamaño k-1 son no vacíos, y cuesta un
+    único AND entre los bits de su padre (sin la última estación) y los de
+    la estación que se agrega. Solo se guarda el nivel anterior.
+    """
     n = len(stations_list)
-    for r in range(min_size, n+1):
-        for combo in itertools.combinations(stations_list, r):
-            results.append(list(combo))
+    nivel = {}
+    for i, st in enumerate(stations_list):
+        if bits_por_estacion[st].any():
+            nivel[(i,)] = bits_por_estacion[st]
+
+    results = []
+    k = 1
+    while nivel:
+        if k >= min_size:
+            for idx in sorted(nivel):
+                results.append(([stations_list[i] for i in idx], nivel[idx]))
+
+        siguiente = {}
+        for padre in sorted(nivel):
+            for j in range(padre[-1] + 1, n):
+                candidato = padre + (j,)
+                # Todos los subconjuntos de tamaño k deben tener detecciones
+                if any(candidato[:m] + candidato[m + 1:] not in nivel for m in range(k)):
+                    continue
+                bits = nivel[padre] & bits_por_estacion[stations_list[j]]
+                if bits.any():
+                    siguiente[candidato] = bits
+        nivel = siguiente
+        k += 1
     return results
 
 # --------------------------------------------------------------------------
@@ -93,22 +140,16 @@ for r_name, r_list in redes.items():
         all_stations.add(st)
 all_stations = list(all_stations)  # Conjunto único de estaciones
 
+# Malla de bloques de 2 horas; cada estación queda como un arreglo de bits
+# empaquetados (np.packbits) con un bit por bloque con detección
+malla = malla_bloques(plot_start, plot_end, interval_hours)
+n_bloques = len(malla)
+time_list = malla.astype(datetime).tolist()
+
 station_detections = {}
 for station in all_stations:
     station_csv = os.path.join(dir_in, station, f"{station}.csv")
-    detections = set()
-    if os.path.exists(station_csv):
-        with open(station_csv, 'r', newline='') as f:
-            reader = csv.reader(f)
-            header = next(reader, None)  # ["time","type","value"]
-            for row in reader:
-                if len(row) < 3:
-                    continue
-                t_str, t_type, t_val = row
-                dt = parse_iso_to_dt(t_str)
-                if plot_start <= dt <= plot_end:
-                    detections.add(dt)
-    station_detections[station] = detections
+    station_detections[station] = np.packbits(leer_presencia_bloques(station_csv, malla))
 
 # --------------------------------------------------------------------------
 # 4. Lógica principal por cada red
@@ -117,39 +158,43 @@ for red_name, stations_list in redes.items():
     red_dir = os.path.join(dir_out, red_name)
     os.makedirs(red_dir, exist_ok=True)
 
-    combos = get_combinations(stations_list, min_red)  
+    # Solo las subcombinaciones con detecciones comunes (las vacías y todas
+    # las que las contienen se podan sin procesarse)
+    subredes = subredes_con_detecciones(stations_list, min_red, station_detections)
+    combos = [combo for combo, _ in subredes]
     intervals_by_combo = {}
 
+    # Las subcombinaciones podadas no se escriben: se borran su CSV y su PNG
+    # de corridas anteriores para que no pasen por resultados actuales (solo
+    # se generan los nombres, sin evaluarlas)
+    vigentes = {"_".join(combo) for combo in combos}
+    for r in range(min_red, len(stations_list) + 1):
+        for combo in itertools.combinations(stations_list, r):
+            combo_name = "_".join(combo)
+            if combo_name in vigentes:
+                continue
+            combo_dir = os.path.join(red_dir, combo_name)
+            for ext in (".csv", ".png"):
+                ruta = os.path.join(combo_dir, f"{combo_name}{ext}")
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            if os.path.isdir(combo_dir) and not os.listdir(combo_dir):
+                os.rmdir(combo_dir)
+
     # ----------------------------------------------------------------------
     # 4.1 Procesar cada subcombinación
     # ----------------------------------------------------------------------
-    for combo in combos:
+    for combo, common_bits in subredes:
         combo_name = "_".join(combo)
         combo_dir = os.path.join(red_dir, combo_name)
         os.makedirs(combo_dir, exist_ok=True)
 
-        # Intersección de detecciones
-        common_set = station_detections[combo[0]]
-        for st in combo[1:]:
-            common_set = common_set.intersection(station_detections[st])
-
-        times_sorted = sorted(common_set)
-
-        # Unir consecutivos (asumiendo delta = 2h => mismo evento)
-        intervals = []
-        if times_sorted:
-            start_event = times_sorted[0]
-            last_time   = times_sorted[0]
-            for i in range(1, len(times_sorted)):
-                dt = times_sorted[i]
-                delta_sec = (dt - last_time).total_seconds()
-                if abs(delta_sec - interval_hours*3600) < 1.0:
-                    last_time = dt
-                else:
-                    intervals.append((start_event, last_time))
-                    start_event = dt
-                    last_time   = dt
-            intervals.append((start_event, last_time))
+        # Intersección de detecciones: ya calculada en el retículo
+        common_mask = np.unpackbits(common_bits, count=n_bloques).astype(bool)
+
+        # Unir consecutivos (bloques contiguos de 2h => mismo evento)
+        ini_idx, fin_idx = tramos_activos(common_mask)
+        intervals = [(malla[i].item(), malla[j].item()) for i, j in zip(ini_idx, fin_idx)]
 
         intervals_by_combo[combo_name] = intervals
 
@@ -167,37 +212,14 @@ for red_name, stations_list in redes.items():
         ax.set_xlabel("Fecha")
         ax.set_ylabel(f"Detección Conjunta ({combo_name})", color='black')
 
-        # Construimos un timeline de 2h para todo el rango
-        time_list = []
-        val_list  = []
-        current_time = plot_start
-        while current_time <= plot_end:
-            # ver si current_time cae en algún intervalo (ini, fin)
-            is_detected = 0
-            for (ini, fin) in intervals:
-                if ini <= current_time <= fin:
-                    is_detected = 1
-                    break
-            time_list.append(current_time)
-            val_list.append(is_detected)
-            current_time += timedelta(hours=interval_hours)
-
-        # Rellenar
-        if any(val_list):
-            state = 0
-            seg_start = None
-            for i in range(len(val_list)):
-                v = val_list[i]
-                if v == 1 and state == 0:
-                    seg_start = time_list[i]
-                    state = 1
-                elif v == 0 and state == 1:
-                    seg_end = time_list[i]
-                    ax.axvspan(seg_start, seg_end, color='blue', alpha=0.3)
-                    state = 0
-            if state == 1:
-                seg_end = time_list[-1]
-                ax.axvspan(seg_start, seg_end, color='blue', alpha=0.3)
+        # Timeline de 2h para todo el rango: la propia máscara de bloques comunes
+        val_list = common_mask
+
+        # Rellenar cada tramo detectado hasta el primer bloque sin detección
+        # (o hasta el final de la malla)
+        for i, j in zip(*tramos_activos(val_list)):
+            seg_end = time_list[min(j + 1, n_bloques - 1)]
+            ax.axvspan(time_list[i], seg_end, color='blue', alpha=0.3)
 
         # Resaltar SSE
         for (sse_ini, sse_fin, magnitude) in all_sse_events:
@@ -254,10 +276,19 @@ for red_name, stations_list in redes.items():
     from matplotlib.cm import get_cmap
     cmap = get_cmap("tab10")
 
+    # Color y franja según la posición de cada subcombinación en la lista
+    # completa (sin podar) de itertools.combinations, para que no cambien
+    # según qué subcombinaciones tengan detecciones
+    posicion = {st: i for i, st in enumerate(stations_list)}
+    n_red = len(stations_list)
     color_map_dict = {}
-    for i, combo in enumerate(combos):
+    rango_en_tamano = {}
+    for combo in combos:
         c_name = "_".join(combo)
+        rango = rango_combinacion([posicion[st] for st in combo], n_red)
+        i = sum(math.comb(n_red, r) for r in range(min_red, len(combo))) + rango
         color_map_dict[c_name] = cmap(i % 10)  # repetirá si hay >10 combos
+        rango_en_tamano[c_name] = rango
 
     for c in range(min_red, max_cardinality+1):
         combos_c = [cb for cb in combos if len(cb) == c]
@@ -279,7 +310,7 @@ for red_name, stations_list in redes.items():
         legend_patches = []
         combos_that_plotted = set()
 
-        for i_combo, combo in enumerate(combos_c):
+        for combo in combos_c:
             c_name = "_".join(combo)
             intervals_c = intervals_by_combo[c_name]
             if not intervals_c:
@@ -287,7 +318,7 @@ for red_name, stations_list in redes.items():
                 continue
 
             color_sub = color_map_dict[c_name]
-            band_bottom = base_level + band_step*i_combo
+            band_bottom = base_level + band_step*rango_en_tamano[c_name]
             band_top    = band_bottom + band_step
             if band_top > 1.0:
                 band_top = 1.0
@@ -2,6 +2,12 @@ from obspy import read, UTCDateTime, Stream
 import numpy as np
 import os
 
+from almacen import guardar_clas_dia
+from calculos import CLASES, clasificar_intervalos, rms_intervalos
+from caches import CacheDias
+from inventario import actualizar_inventario, archivos_dia, firma_dia, reporte_completitud
+from paralelo import mapear_con_precarga
+
 # ---------------------------------------------------
 # 1. PARÁMETROS PRINCIPALES
 # ---------------------------------------------------
@@ -24,6 +30,10 @@ fn_heads = [
     r"T:\Estaciones\PJIM",
 ]
 
+# Índice persistente de los archivos crudos de fn_heads (inventario.py): se
+# vuelve a listar un directorio solo cuando cambia su mtime
+ruta_inventario = r"T:\SSE\inventario_crudos.json"
+
 # Fechas a procesar
 startday = UTCDateTime(2018, 1, 1)
 endday   = UTCDateTime(2018, 12, 31)
@@ -33,6 +43,15 @@ interval_minutes = 1
 # Cantidad de intervalos de 1 minuto que hay en 1 día (24*60 = 1440)
 num_intervals = int(1440 / interval_minutes)
 
+# Minutos alrededor de cada "c" que se marcan como "c1" (±20 min)
+c1_minutes = 20
+# Radio de la expansión "c1" en número de intervalos
+radio_c1 = int(round(c1_minutes / interval_minutes))
+
+# La clasificación se guarda en un .npy anual por estación (rms_clas);
+# con True se escribe además el {station}_{date}_clas.csv de texto
+clas_texto = False
+
 # ---------------------------------------------------
 # NUEVOS PARÁMETROS PARA CONVERSIÓN Y RUIDO
 # ---------------------------------------------------
@@ -44,11 +63,41 @@ max_noise = [2e-7, 2e-7, 2e-7, 2e-7]
 min_noise = [1e-4, 1e-3, 1e-3, 1e-4]
 
 # ---------------------------------------------------
-# 2. BUCLE PRINCIPAL SOBRE COMBINACIONES DE FRECUENCIA
+# CACHÉ DE DÍAS DECODIFICADOS (opcional)
+# ---------------------------------------------------
+# Con un directorio, cada día leído (3 trazas) se guarda como .npy + .json
+# (caches.CacheDias) y las corridas siguientes lo cargan con mmap en vez de
+# decodificar el miniSEED. None = sin caché.
+cache_dias_dir = None  # p.ej. r"T:\SSE\cache_dias"
+cache_dias_max_gb = 50
+cache_dias = (
+    CacheDias(cache_dias_dir, cache_dias_max_gb * 1024**3) if cache_dias_dir else None
+)
+
+# ---------------------------------------------------
+# EJECUCIÓN EN PARALELO
+# ---------------------------------------------------
+# Procesos que atienden tareas (estación, día) a la vez; 1 = en serie.
+# Cada worker calcula y escribe sus CSV de RMS; la clasificación se devuelve
+# al proceso principal, único que escribe en los .npy anuales.
+n_workers = 1
+
+# Días leídos por adelantado (en un hilo) mientras se calcula el actual;
+# acota la memoria a prefetch_dias + 2 días por proceso
+prefetch_dias = 1
+
+# ---------------------------------------------------
+# 2. COMBINACIONES DE FRECUENCIA Y DIRECTORIOS DE SALIDA
 # ---------------------------------------------------
-for hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max in zip(
+# Cada día de cada estación se lee una sola vez y, con la misma señal en
+# memoria, se generan las salidas de todas las combinaciones HF/LF
+freq_combos = list(zip(
     hf_freq_min_list, hf_freq_max_list, lf_freq_min_list, lf_freq_max_list
-):
+))
+
+# Directorios de salida (rms, rms_clas) por combinación
+dirs_out = []
+for hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max in freq_combos:
     # Construye la ruta base según las frecuencias
     dir_base = os.path.join(
         r"T:\SSE",
@@ -58,176 +107,216 @@ for hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max in zip(
     # Directorios de salida para esta combinación de frecuencias
     dir_out = os.path.join(dir_base, "rms")
     dir_out_clas = os.path.join(dir_base, "rms_clas")
+    dirs_out.append((dir_out, dir_out_clas))
 
-    # Crear directorios si no existen
-    os.makedirs(dir_out, exist_ok=True)
-    os.makedirs(dir_out_clas, exist_ok=True)
+# ---------------------------------------------------
+# 3. PROCESAMIENTO DE UN DÍA DE UNA ESTACIÓN
+#    leer_dia (E/S) corre en un hilo de fondo adelantado a calcular_dia
+# ---------------------------------------------------
+def leer_dia(tarea):
+    """
+    tarea = (station_index, day, archivos), con archivos = {component:
+    [rutas]} tomado del inventario. La firma para la caché de días se arma
+    con un os.stat de los archivos que efectivamente se leen.
+    Devuelve el Stream del día (de la caché de días si está vigente, si no
+    del miniSEED) o None si no se encuentran las 3 componentes.
+    """
+    station_index, day, archivos = tarea
+    station = stations[station_index]
+    date = f"{day.year}{str(day.julday).zfill(3)}"
+
+    # -----------------------------------------------
+    # 3.1 Lectura de datos (una sola vez para todas las combinaciones):
+    #     de la caché de días si está vigente, si no del miniSEED
+    # -----------------------------------------------
+    st = cache_dias.get(station, date) if cache_dias is not None else None
+    if st is not None:
+        return st
+
+    st = Stream()
+    firma = []
+    components_loaded = 0
+    for component in components:
+        file_found = False
+        # Rutas del inventario en el orden de fn_heads (sin os.path.exists)
+        for fn in archivos[component]:
+            try:
+                firma_fn = firma_dia([fn])  # antes de leer
+                st += read(fn)
+                firma += firma_fn
+                components_loaded += 1
+                file_found = True
+                break
+            except Exception as e:
+                # Puedes imprimir o manejar la excepción si lo deseas
+                continue
 
-    print("======================================")
-    print(f"Procesando combinación de frecuencias:")
-    print(f"HF: {hf_freq_min}–{hf_freq_max} Hz | LF: {lf_freq_min}–{lf_freq_max} Hz")
-    print(f"Carpeta de salida: {dir_base}")
-    print("======================================")
+        if not file_found:
+            print(f"Archivo no encontrado para {component}, día {date}")
 
-    # ---------------------------------------------------
-    # 3. BUCLE SOBRE ESTACIONES
-    # ---------------------------------------------------
-    for station_index, station in enumerate(stations):
-        # dt propio de la estación
-        dt = dt_list[station_index]
+    # Si no se encuentran al menos 3 componentes, se pasa al siguiente día
+    if components_loaded < 3:
+        print(f"Componentes insuficientes ({components_loaded}) para {station} el día {date}")
+        return None
 
-        # Factores de conversión y ruido para la estación
-        factor_counts = conversion_factor[station_index]
-        noise_max_m_s = max_noise[station_index]
-        noise_min_m_s = min_noise[station_index]
+    if cache_dias is not None:
+        cache_dias.put(station, date, firma, st)
+    return st
 
-        # Reiniciamos la fecha de inicio para cada estación
-        day = startday
+def calcular_dia(tarea, st):
+    """
+    Con el Stream del día (leer_dia) escribe el CSV de RMS de cada
+    combinación (vía temporal + os.replace) y devuelve (station, day,
+    categorías por combinación), o categorías None si no hubo datos.
+    """
+    station_index, day, _ = tarea
+    station = stations[station_index]
+    if st is None:
+        return station, day, None
 
-        # ---------------------------------------------------
-        # 4. BUCLE SOBRE DÍAS
-        # ---------------------------------------------------
-        while day <= endday:
-            date = f"{day.year}{str(day.julday).zfill(3)}"
-            print(f"\nEstación {station}, día {day.strftime('%Y-%m-%d')}, dt={dt} s")
-
-            st = Stream()
-            components_loaded = 0
-
-            # -----------------------------------------------
-            # 4.1 Lectura de datos
-            # -----------------------------------------------
-            for component in components:
-                file_found = False
-                for fn_head in fn_heads:
-                    fn = os.path.join(fn_head, f"i4.{station}.{component}.{date}_0+")
-                    if os.path.exists(fn):
-                        try:
-                            st += read(fn)
-                            components_loaded += 1
-                            file_found = True
-                            break
-                        except Exception as e:
-                            # Puedes imprimir o manejar la excepción si lo deseas
-                            continue
-
-                if not file_found:
-                    print(f"Archivo no encontrado para {component}, día {date}")
-
-            # Si no se encuentran al menos 3 componentes, se pasa al siguiente día
-            if components_loaded < 3:
-                print(f"Componentes insuficientes ({components_loaded}) para {station} el día {date}")
-                day += 86400
-                continue
+    # dt propio de la estación
+    dt = dt_list[station_index]
 
-            # -----------------------------------------------
-            # 4.2 Aplicar filtros HF y LF
-            # -----------------------------------------------
-            st_hf = st.copy().filter(
-                type="bandpass",
-                freqmin=hf_freq_min,
-                freqmax=hf_freq_max,
-                corners=2,
-                zerophase=True
-            )
-            st_lf = st.copy().detrend("linear").filter(
-                type="bandpass",
-                freqmin=lf_freq_min,
-                freqmax=lf_freq_max,
-                corners=2,
-                zerophase=True
-            )
+    # Factores de conversión y ruido para la estación
+    factor_counts = conversion_factor[station_index]
+    noise_max_m_s = max_noise[station_index]
+    noise_min_m_s = min_noise[station_index]
 
-            # -----------------------------------------------
-            # 4.3 Preparar archivos de salida
-            # -----------------------------------------------
-            output_file = os.path.join(dir_out, f"{station}_{date}.csv")
+    date = f"{day.year}{str(day.julday).zfill(3)}"
+    print(f"\nEstación {station}, día {day.strftime('%Y-%m-%d')}, dt={dt} s")
+
+    # ---------------------------------------------------
+    # 3.2 BUCLE SOBRE COMBINACIONES DE FRECUENCIA (mismo día en memoria)
+    # ---------------------------------------------------
+    categorias = []
+    for (hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max), (dir_out, dir_out_clas) in zip(
+        freq_combos, dirs_out
+    ):
+        # -----------------------------------------------
+        # 3.3 Aplicar filtros HF y LF
+        # -----------------------------------------------
+        st_hf = st.copy().filter(
+            type="bandpass",
+            freqmin=hf_freq_min,
+            freqmax=hf_freq_max,
+            corners=2,
+            zerophase=True
+        )
+        st_lf = st.copy().detrend("linear").filter(
+            type="bandpass",
+            freqmin=lf_freq_min,
+            freqmax=lf_freq_max,
+            corners=2,
+            zerophase=True
+        )
+
+        # -----------------------------------------------
+        # 3.4 RMS por intervalo (en minutos), todas las columnas a la vez
+        # -----------------------------------------------
+        # ipts0, ipts1 se calculan usando dt específico de esta estación
+        # (mismas operaciones que int(interval * interval_minutes * 60 / dt))
+        limites = (np.arange(num_intervals + 1) * interval_minutes * 60 / dt).astype(int)
+        ipts0 = limites[:-1]
+        ipts1 = np.minimum(limites[1:], st[0].stats.npts)
+
+        # RMS HF y LF en cada componente (en counts), filas = intervalos
+        rms_hf = np.column_stack([rms_intervalos(tr.data, ipts0, ipts1) for tr in st_hf[:3]])
+        rms_lf = np.column_stack([rms_intervalos(tr.data, ipts0, ipts1) for tr in st_lf[:3]])
+
+        # RMS horizontal y total en alta y baja frecuencia (EN COUNTS)
+        rms_hfhor = np.sqrt(rms_hf[:, 1] ** 2 + rms_hf[:, 2] ** 2)
+        rms_hfall = np.sqrt(rms_hf[:, 0] ** 2 + rms_hf[:, 1] ** 2 + rms_hf[:, 2] ** 2)
+        rms_lfhor = np.sqrt(rms_lf[:, 1] ** 2 + rms_lf[:, 2] ** 2)
+        rms_lfall = np.sqrt(rms_lf[:, 0] ** 2 + rms_lf[:, 1] ** 2 + rms_lf[:, 2] ** 2)
+
+        # -----------------------------------------------
+        # 3.5 Guardar RMS (CSV, todas las líneas de una vez, en counts)
+        # -----------------------------------------------
+        output_file = os.path.join(dir_out, f"{station}_{date}.csv")
+        tmp_file = output_file + ".tmp"
+        with open(tmp_file, mode="w") as f_out:
+            np.savetxt(
+                f_out,
+                np.column_stack([rms_hf, rms_hfhor, rms_hfall, rms_lf, rms_lfhor, rms_lfall]),
+                fmt="%.3e",
+                delimiter=","
+            )
+        os.replace(tmp_file, output_file)
+
+        # -------------------------------------------
+        # CLASIFICACIÓN
+        # -------------------------------------------
+        # Convertimos el max_noise (m/s) a counts
+        max_noise_counts = factor_counts * noise_max_m_s
+        # Convertimos el min_noise (m/s) a counts
+        min_noise_counts = factor_counts * noise_min_m_s
+
+        # -------------------------------------------
+        # 3.6 Clasificación a/b/c y post-procesamiento ("d", "c1")
+        #     sobre códigos enteros, con dilataciones en vez de bucles
+        # -------------------------------------------
+        categories = clasificar_intervalos(
+            rms_lfhor, min_noise_counts, max_noise_counts, radio_c1
+        )
+
+        # El .npy anual ({station}_{año}_clas.npy) lo escribe el proceso principal
+        categorias.append(categories)
+
+        # Copia en texto (una letra por línea) solo si se pide para inspección
+        if clas_texto:
             classification_file = os.path.join(dir_out_clas, f"{station}_{date}_clas.csv")
+            with open(classification_file + ".tmp", mode="w") as f_class:
+                f_class.write("".join(f"{CLASES[c]}\n" for c in categories))
+            os.replace(classification_file + ".tmp", classification_file)
 
-            with open(output_file, mode="w") as f_out, open(classification_file, mode="w") as f_class:
-                categories = []
-
-                # -------------------------------------------
-                # 4.4 Bucle sobre intervalos (en minutos)
-                # -------------------------------------------
-                for interval in range(num_intervals):
-                    # ipts0, ipts1 se calculan usando dt específico de esta estación
-                    ipts0 = int(interval * interval_minutes * 60 / dt)
-                    ipts1 = min(
-                        int((interval + 1) * interval_minutes * 60 / dt),
-                        st[0].stats.npts
-                    )
-
-                    # Vectores para RMS HF y LF en cada componente (en counts)
-                    rms_hf = [0, 0, 0]
-                    rms_lf = [0, 0, 0]
-
-                    # Calcular RMS para cada componente
-                    for j in range(3):
-                        data_hf = st_hf[j].data[ipts0:ipts1]
-                        data_lf = st_lf[j].data[ipts0:ipts1]
-
-                        if len(data_hf) == 0 or len(data_lf) == 0:
-                            rms_hf[j] = 0
-                            rms_lf[j] = 0
-                        else:
-                            rms_hf[j] = np.sqrt(np.mean(data_hf ** 2))
-                            rms_lf[j] = np.sqrt(np.mean(data_lf ** 2))
-
-                    # RMS horizontal y total en alta y baja frecuencia (EN COUNTS)
-                    rms_hfhor = np.sqrt(rms_hf[1] ** 2 + rms_hf[2] ** 2)
-                    rms_hfall = np.sqrt(rms_hf[0] ** 2 + rms_hf[1] ** 2 + rms_hf[2] ** 2)
-                    rms_lfhor = np.sqrt(rms_lf[1] ** 2 + rms_lf[2] ** 2)
-                    rms_lfall = np.sqrt(rms_lf[0] ** 2 + rms_lf[1] ** 2 + rms_lf[2] ** 2)
-
-                    # Escribir la línea de datos en CSV (RMS en counts)
-                    f_out.write(
-                        f"{rms_hf[0]:.3e},{rms_hf[1]:.3e},{rms_hf[2]:.3e},"
-                        f"{rms_hfhor:.3e},{rms_hfall:.3e},"
-                        f"{rms_lf[0]:.3e},{rms_lf[1]:.3e},{rms_lf[2]:.3e},"
-                        f"{rms_lfhor:.3e},{rms_lfall:.3e}\n"
-                    )
-
-                    # -------------------------------------------
-                    # CLASIFICACIÓN
-                    # -------------------------------------------
-                    # Convertimos el max_noise (m/s) a counts
-                    max_noise_counts = factor_counts * noise_max_m_s
-                    # Convertimos el min_noise (m/s) a counts
-                    min_noise_counts = factor_counts * noise_min_m_s
-
-                    category = "b"
-                    if rms_lfhor < min_noise_counts:
-                        category = "c"
-                    elif rms_lfhor > max_noise_counts:
-                        category = "a"
-
-                    categories.append(category)
-
-                # -------------------------------------------
-                # 4.5 Post-procesamiento de clasificaciones
-                # -------------------------------------------
-                # Cambiar "b" a "d" si está entre "a" o "c"
-                for i in range(1, len(categories) - 1):
-                    if categories[i] == "b":
-                        if (categories[i - 1] in {"c", "a"}) or (categories[i + 1] in {"c", "a"}):
-                            categories[i] = "d"
-
-                # Extender la "c" ±20 min marcándolas como "c1"
-                for i, category in enumerate(categories):
-                    if category == "c":
-                        for offset in range(-20, 21):
-                            idx = i + offset
-                            if 0 <= idx < len(categories) and categories[idx] != "c":
-                                categories[idx] = "c1"
-
-                # Escribir clasificaciones en archivo
-                for category in categories:
-                    f_class.write(f"{category}\n")
-
-            # Avanzar un día
-            day += 86400
-
-    # Fin del bucle de estaciones
-
-# Fin del bucle de combinaciones de frecuencias
+    return station, day, categorias
+
+# ---------------------------------------------------
+# 4. BUCLE SOBRE ESTACIONES Y DÍAS
+# ---------------------------------------------------
+if __name__ == "__main__":
+    for (hf_freq_min, hf_freq_max, lf_freq_min, lf_freq_max), (dir_out, dir_out_clas) in zip(
+        freq_combos, dirs_out
+    ):
+        # Crear directorios si no existen
+        os.makedirs(dir_out, exist_ok=True)
+        os.makedirs(dir_out_clas, exist_ok=True)
+
+        print("======================================")
+        print(f"Combinación de frecuencias:")
+        print(f"HF: {hf_freq_min}–{hf_freq_max} Hz | LF: {lf_freq_min}–{lf_freq_max} Hz")
+        print(f"Carpeta de salida: {os.path.dirname(dir_out)}")
+        print("======================================")
+
+    # Inventario de archivos crudos y días con las 3 componentes
+    dias = []
+    day = startday
+    while day <= endday:
+        dias.append(day)
+        day += 86400
+    fechas = [f"{d.year}{str(d.julday).zfill(3)}" for d in dias]
+    inventario = actualizar_inventario(fn_heads, ruta_inventario, fechas=fechas)
+    completos = reporte_completitud(inventario, stations, components, fechas)
+
+    # Una tarea por estación y día completo (los incompletos ya se reportaron)
+    tareas = []
+    for station_index, station in enumerate(stations):
+        for day in dias:
+            date = f"{day.year}{str(day.julday).zfill(3)}"
+            if date in completos[station]:
+                tareas.append((
+                    station_index, day,
+                    archivos_dia(inventario, station, components, date)
+                ))
+
+    # Los resultados llegan en el orden de las tareas, igual que en serie
+    for station, day, categorias in mapear_con_precarga(
+        leer_dia, calcular_dia, tareas, n_workers, prefetch_dias
+    ):
+        if categorias is None:
+            continue
+        for (dir_out, dir_out_clas), categories in zip(dirs_out, categorias):
+            # Guardar en el archivo anual binario de la estación ({station}_{año}_clas.npy)
+            guardar_clas_dia(dir_out_clas, station, day.year, day.julday, categories)
+
+# Fin del bucle de estaciones
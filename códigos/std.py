@@ -1,9 +1,12 @@
 import os
 import csv
-from obspy import UTCDateTime
-from datetime import timedelta
+from datetime import date, timedelta
 import numpy as np
 
+from almacen import (anios_serie, dias_serie_anio, guardar_stats_dias, leer_serie_dia,
+                     leer_stats_dias, ruta_serie_anual)
+from calculos import acumular_signos
+
 # =============================================================================
 # Parámetros principales
 # =============================================================================
@@ -19,6 +22,16 @@ par_days = 28
 min_days_required = 28       # Al menos 28 días efectivos en la ventana
 min_coverage_ratio = 0.50    # Al menos 50% de muestras válidas (CCMA != 0)
 
+# Modo incremental: además de agregar días nuevos, reescribe las filas de
+# {station}.csv cuya ventana ±par_days cambió por días de CCMA nuevos o
+# modificados (detectados comparando con {station}_stats.npz de la corrida
+# anterior). Con False solo se agregan los días faltantes.
+incremental = False
+
+# Parámetros de la ventana guardados junto a los estadísticos diarios: si
+# cambian, en modo incremental se recalculan todos los días
+parametros_ventana = [par_days, min_days_required, min_coverage_ratio]
+
 # Crear carpeta de salida si no existe
 os.makedirs(dir_out_std, exist_ok=True)
 
@@ -51,65 +64,118 @@ for st in stations:
 # Ajusta si tus archivos usan otro formato (YYYYMMDD, etc.)
 # =============================================================================
 
-def parse_day_str_to_utc(day_str):
+def format_utc_to_day_str(dt):
+    """
+    Convierte un UTCDateTime a 'YYYYDDD'.
+    Ajusta si deseas otro formato (p.ej. 'YYYYMMDD').
+    """
+    return f"{dt.year}{str(dt.julday).zfill(3)}"
+
+def day_str_to_ordinal(day_str):
     """
-    Convierte un string 'YYYYDDD' a UTCDateTime.
-    Por ejemplo, '2022015' => 2022, día 15 del año (15 enero 2022).
-    Si tus archivos usan 'YYYYMMDD', debes adaptar este parseo.
+    Convierte 'YYYYDDD' a un número de día consecutivo (ordinal de datetime),
+    para medir distancias en días con aritmética entera.
     """
     year = int(day_str[:4])
     jday = int(day_str[4:])
-    return UTCDateTime(year=year, julday=jday)
+    return date(year, 1, 1).toordinal() + jday - 1
 
-def format_utc_to_day_str(dt):
+def day_stats(values):
     """
-    Convierte un UTCDateTime a 'YYYYDDD'.
-    Ajusta si deseas otro formato (p.ej. 'YYYYMMDD').
+    Estadísticos suficientes de un día de CCMA:
+    [total_puntos, puntos_no_nulos, n_pos, ss_pos, n_neg, ss_neg]
+    Sumados sobre varios días dan la cobertura y la std simétrica de la ventana.
     """
-    return f"{dt.year}{str(dt.julday).zfill(3)}"
+    values = np.asarray(values, dtype=np.float64)
+    return np.concatenate([[values.size, np.count_nonzero(values)], acumular_signos(values)])
 
-def load_ccma_data(station):
+def load_ccma_stats(station, prev_stats=None, prev_mtimes=None):
     """
-    Carga todos los archivos .csv de CCMA para una estación dada.
-    Devuelve un diccionario: day_str -> lista de valores CCMA.
+    Recorre todos los días de CCMA de una estación (.npy anuales) y calcula
+    una sola vez sus estadísticos diarios. Los años cuyo archivo anual tiene
+    el mismo mtime que en la corrida anterior (prev_mtimes) toman sus
+    estadísticos de prev_stats sin volver a leer el CCMA.
+    Devuelve (day_str_list ordenada, matriz n_días x 6 de day_stats,
+    {year: mtime} de los archivos anuales).
     (day_str típicamente 'YYYYDDD')
     """
-    station_folder = os.path.join(dir_ccma, station)
-    data_by_day = {}
-    if not os.path.exists(station_folder):
-        return data_by_day
-
-    for file_name in os.listdir(station_folder):
-        if not file_name.endswith(".csv"):
+    prev_stats = prev_stats or {}
+    prev_mtimes = prev_mtimes or {}
+    day_str_list = []
+    stats = []
+    mtimes = {}
+    for year in anios_serie(dir_ccma, station):
+        mtimes[year] = os.path.getmtime(ruta_serie_anual(dir_ccma, station, year))
+        if prev_mtimes.get(year) == mtimes[year]:
+            for dstr in sorted(d for d in prev_stats if d.startswith(str(year))):
+                day_str_list.append(dstr)
+                stats.append(prev_stats[dstr])
             continue
-        # Extraemos "YYYYDDD" del nombre
-        day_str = file_name.replace(".csv", "")
+        for julday in dias_serie_anio(dir_ccma, station, year):
+            day_str_list.append(f"{year}{str(julday).zfill(3)}")
+            stats.append(day_stats(leer_serie_dia(dir_ccma, station, year, julday)))
 
-        file_path = os.path.join(station_folder, file_name)
-        ccma_values = []
-        with open(file_path, 'r', newline='') as f:
-            reader = csv.reader(f)
-            header = next(reader, None)  # ["Tiempo (s)", "CCMA"]
-            for row in reader:
-                if len(row) < 2:
-                    continue
-                try:
-                    val = float(row[1])
-                    ccma_values.append(val)
-                except ValueError:
-                    pass
+    return day_str_list, np.array(stats).reshape(len(stats), 6), mtimes
 
-        data_by_day[day_str] = ccma_values
+# =============================================================================
+# Paso 1: Estadísticos diarios de CCMA para todas las estaciones
+# =============================================================================
+
+# En modo incremental se parte de los estadísticos de la corrida anterior
+prev_by_station = {
+    st: leer_stats_dias(os.path.join(dir_out_std, f"{st}_stats.npz")) if incremental
+        else ({}, None, {})
+    for st in stations
+}
 
-    return data_by_day
+ccma_stats = {}
+ccma_mtimes = {}
+for st in stations:
+    prev_stats, _, prev_mtimes = prev_by_station[st]
+    day_str_list, stats, ccma_mtimes[st] = load_ccma_stats(st, prev_stats, prev_mtimes)
+    ccma_stats[st] = (day_str_list, stats)
 
 # =============================================================================
-# Paso 1: Cargar datos de CCMA para todas las estaciones
+# Paso 1b (modo incremental): días cuya ventana ± par_days cambió
+#   Un día de CCMA cambió si es nuevo, si desapareció o si sus estadísticos
+#   difieren de los guardados en la corrida anterior; se ven afectados todos
+#   los días a <= par_days de alguno de ellos. Si los parámetros de la
+#   ventana no son los guardados, se ven afectados todos los días.
 # =============================================================================
 
-all_ccma_data = {}
-for st in stations:
-    all_ccma_data[st] = load_ccma_data(st)
+def find_affected_days(day_str_list, stats, prev_stats):
+    """
+    Devuelve el conjunto de day_str de day_str_list cuya ventana contiene
+    algún día nuevo, eliminado o modificado respecto a prev_stats.
+    """
+    current_days = set(day_str_list)
+    changed = [
+        dstr for dstr, row in zip(day_str_list, stats)
+        if dstr not in prev_stats or not np.array_equal(prev_stats[dstr], row)
+    ]
+    changed += [dstr for dstr in prev_stats if dstr not in current_days]
+    if not changed or not day_str_list:
+        return set()
+
+    ordinals = np.array([day_str_to_ordinal(dstr) for dstr in day_str_list])
+    changed_ord = np.sort([day_str_to_ordinal(dstr) for dstr in changed])
+
+    # Distancia al día cambiado más cercano (anterior o posterior)
+    idx = np.searchsorted(changed_ord, ordinals)
+    dist_next = np.abs(changed_ord[np.minimum(idx, len(changed_ord) - 1)] - ordinals)
+    dist_prev = np.abs(ordinals - changed_ord[np.maximum(idx - 1, 0)])
+    near = np.minimum(dist_next, dist_prev) <= par_days
+
+    return {dstr for dstr, n in zip(day_str_list, near) if n}
+
+affected_days = {st: set() for st in stations}
+if incremental:
+    for st in stations:
+        prev_stats, prev_parametros, _ = prev_by_station[st]
+        if prev_parametros is None or not np.array_equal(prev_parametros, parametros_ventana):
+            affected_days[st] = set(ccma_stats[st][0])
+        else:
+            affected_days[st] = find_affected_days(*ccma_stats[st], prev_stats)
 
 # =============================================================================
 # Estructura para guardar std_neg y std_pos: 
@@ -120,90 +186,51 @@ std_by_station_and_day = {st: {} for st in stations}
 
 # =============================================================================
 # Paso 2: Calcular std_neg y std_pos para cada día (ventana ± par_days)
+#   Los totales de cada ventana salen de sumas acumuladas sobre el eje de
+#   días (O(D) en vez de O(D^2)). Criterios iguales a los de siempre:
+#     - días en la ventana >= min_days_required
+#     - cobertura (CCMA != 0) >= min_coverage_ratio
+#     - std simétrica (ccma.py): positives -> concatenar(positives, -positives)
+#       => std = sqrt(ss_pos / n_pos), igual para negatives
 # =============================================================================
 
-def calc_std_neg_pos(values_array):
-    """
-    Recibe un array con valores CCMA != 0.
-    Retorna (std_neg, std_pos) siguiendo el criterio de ccma.py
-    usando distribución simétrica: 
-      - positives -> concatenar(positives, -positives) => std
-      - negatives -> concatenar(negatives, -negatives) => std
-    """
-    positives = values_array[values_array > 0]
-    negatives = values_array[values_array < 0]
-
-    # Calcular std_pos
-    if positives.size > 0:
-        sym_pos = np.concatenate([positives, -positives])
-        std_pos = np.std(sym_pos, ddof=0)  # ddof=0 => población
-    else:
-        std_pos = 0.0
-
-    # Calcular std_neg
-    if negatives.size > 0:
-        sym_neg = np.concatenate([negatives, -negatives])
-        std_neg = np.std(sym_neg, ddof=0)
-    else:
-        std_neg = 0.0
-
-    return std_neg, std_pos
-
 for station in stations:
-    data_by_day = all_ccma_data[station]  # {day_str: [ccma_vals]}
-    day_str_list = sorted(data_by_day.keys(), key=lambda ds: parse_day_str_to_utc(ds))
-
-    for dstr in day_str_list:
-        day_utc = parse_day_str_to_utc(dstr)
-        left_utc  = day_utc - 86400 * par_days
-        right_utc = day_utc + 86400 * par_days
-
-        combined_ccma = []
-        days_in_window = 0
+    day_str_list, stats = ccma_stats[station]
+    if not day_str_list:
+        continue
 
-        # 1) Contar días en la ventana
-        for candidate_str in day_str_list:
-            cand_utc = parse_day_str_to_utc(candidate_str)
-            if left_utc <= cand_utc <= right_utc:
-                days_in_window += 1
+    ordinals = np.array([day_str_to_ordinal(dstr) for dstr in day_str_list])
 
-        if days_in_window < min_days_required:
-            std_by_station_and_day[station][dstr] = (None, None)
-            continue
+    # Sumas acumuladas de los estadísticos diarios
+    stats_acum = np.zeros((len(day_str_list) + 1, stats.shape[1]))
+    np.cumsum(stats, axis=0, out=stats_acum[1:])
 
-        # 2) Validar ratio de cobertura
-        total_ccma_points = 0
-        nonzero_points = 0
+    # Días disponibles en [día - par_days, día + par_days]
+    left  = np.searchsorted(ordinals, ordinals - par_days, side="left")
+    right = np.searchsorted(ordinals, ordinals + par_days, side="right")
+    days_in_window = right - left
 
-        for candidate_str in day_str_list:
-            cand_utc = parse_day_str_to_utc(candidate_str)
-            if left_utc <= cand_utc <= right_utc:
-                ccma_list = data_by_day[candidate_str]
-                total_ccma_points += len(ccma_list)
-                nonzero_points     += sum(1 for v in ccma_list if v != 0.0)
-
-        if total_ccma_points == 0:
-            std_by_station_and_day[station][dstr] = (None, None)
-            continue
+    total_ccma_points, nonzero_points, n_pos, ss_pos, n_neg, ss_neg = (
+        stats_acum[right] - stats_acum[left]
+    ).T
 
+    with np.errstate(divide="ignore", invalid="ignore"):
         coverage_ratio = nonzero_points / total_ccma_points
-        if coverage_ratio < min_coverage_ratio:
-            std_by_station_and_day[station][dstr] = (None, None)
-            continue
-
-        # 3) Recolectar CCMA != 0 en la ventana
-        for candidate_str in day_str_list:
-            cand_utc = parse_day_str_to_utc(candidate_str)
-            if left_utc <= cand_utc <= right_utc:
-                valid_vals = [v for v in data_by_day[candidate_str] if v != 0.0]
-                combined_ccma.extend(valid_vals)
-
-        arr_ccma = np.array(combined_ccma, dtype=float)
-        if len(arr_ccma) == 0:
-            std_by_station_and_day[station][dstr] = (None, None)
+        std_pos = np.where(n_pos > 0, np.sqrt(ss_pos / n_pos), 0.0)
+        std_neg = np.where(n_neg > 0, np.sqrt(ss_neg / n_neg), 0.0)
+
+    valid = (
+        (days_in_window >= min_days_required)
+        & (total_ccma_points > 0)
+        & (coverage_ratio >= min_coverage_ratio)
+        & (nonzero_points > 0)
+    )
+
+    for i, dstr in enumerate(day_str_list):
+        if valid[i]:
+            std_by_station_and_day[station][dstr] = (std_neg[i], std_pos[i])
         else:
-            std_neg, std_pos = calc_std_neg_pos(arr_ccma)
-            std_by_station_and_day[station][dstr] = (std_neg, std_pos)
+            std_by_station_and_day[station][dstr] = (None, None)
 
 # =============================================================================
 # Paso 3: Rellenar valores None usando el día válido más cercano (hacia adelante y atrás)
@@ -239,8 +266,16 @@ def fill_missing_with_nearest(day_list, std_map):
             if next_valid is not None:
                 std_map[dstr] = next_valid
 
+# Días sin std propia: su valor final depende de los vecinos, así que en
+# modo incremental se reescriben siempre
+filled_days = {
+    st: {dstr for dstr, (std_neg, std_pos) in std_by_station_and_day[st].items()
+         if std_neg is None or std_pos is None}
+    for st in stations
+}
+
 for station in stations:
-    day_str_list = sorted(all_ccma_data[station].keys(), key=lambda ds: parse_day_str_to_utc(ds))
+    day_str_list = ccma_stats[station][0]
     fill_missing_with_nearest(day_str_list, std_by_station_and_day[station])
 
 # =============================================================================
@@ -255,20 +290,65 @@ for station in stations:
 
 # =============================================================================
 # Paso 4: Guardar en {station}.csv con columnas: day_str, std_neg, std_pos
-#         Si el archivo existe, solo agregamos días faltantes
+#         Si el archivo existe, solo agregamos días faltantes; en modo
+#         incremental además se reescriben las filas de días afectados
 #         *** Se agrega tope de 0.1 al final ***
 # =============================================================================
 
+def format_std_row(station, dstr):
+    """Fila [day_str, std_neg, std_pos] con 6 decimales y tope de 0.1."""
+    (std_neg, std_pos) = std_by_station_and_day[station][dstr]
+    # Por seguridad, si quedara None
+    if std_neg is None:
+        std_neg = global_std[station][0]
+    if std_pos is None:
+        std_pos = global_std[station][1]
+
+    # *** Ajustar máximo a 0.1 ***
+    if std_neg > 0.1:
+        std_neg = 0.1
+    if std_pos > 0.1:
+        std_pos = 0.1
+
+    # Guardar con 6 decimales
+    return [dstr, f"{std_neg:.6f}", f"{std_pos:.6f}"]
+
 for station in stations:
     output_file = os.path.join(dir_out_std, f"{station}.csv")
-    existing_days = set()
+    day_str_list = ccma_stats[station][0]
+
+    # Filas existentes, en su orden original: day_str -> fila
+    existing_rows = {}
     if os.path.exists(output_file):
         with open(output_file, 'r', newline='') as f:
             reader = csv.reader(f)
             header = next(reader, None)  # "day_str", "std_neg", "std_pos"
             for row in reader:
                 if row:
-                    existing_days.add(row[0])
+                    existing_rows[row[0]] = row
+
+    if incremental:
+        # Reescribir filas afectadas (o rellenadas) y agregar las nuevas
+        refresh = (affected_days[station] | filled_days[station]) & set(existing_rows)
+        new_days = [dstr for dstr in day_str_list if dstr not in existing_rows]
+        for dstr in day_str_list:
+            if dstr not in existing_rows or dstr in refresh:
+                existing_rows[dstr] = format_std_row(station, dstr)
+
+        tmp_file = output_file + ".tmp"
+        with open(tmp_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["day_str", "std_neg", "std_pos"])
+            writer.writerows(existing_rows.values())
+        os.replace(tmp_file, output_file)
+
+        # Estadísticos de esta corrida para detectar cambios en la siguiente
+        guardar_stats_dias(
+            os.path.join(dir_out_std, f"{station}_stats.npz"), *ccma_stats[station],
+            parametros_ventana, ccma_mtimes[station]
+        )
+        print(f"[{station}] {len(refresh)} días recalculados, {len(new_days)} días nuevos.")
+        continue
 
     with open(output_file, 'a', newline='') as f:
         writer = csv.writer(f)
@@ -276,23 +356,8 @@ for station in stations:
         if os.path.getsize(output_file) == 0:
             writer.writerow(["day_str", "std_neg", "std_pos"])
 
-        day_str_list = sorted(all_ccma_data[station].keys(), key=lambda ds: parse_day_str_to_utc(ds))
         for dstr in day_str_list:
-            if dstr not in existing_days:
-                (std_neg, std_pos) = std_by_station_and_day[station][dstr]
-                # Por seguridad, si quedara None
-                if std_neg is None:
-                    std_neg = global_std[station][0]
-                if std_pos is None:
-                    std_pos = global_std[station][1]
-
-                # *** Ajustar máximo a 0.1 ***
-                if std_neg > 0.1:
-                    std_neg = 0.1
-                if std_pos > 0.1:
-                    std_pos = 0.1
-
-                # Guardar con 6 decimales
-                writer.writerow([dstr, f"{std_neg:.6f}", f"{std_pos:.6f}"])
+            if dstr not in existing_rows:
+                writer.writerow(format_std_row(station, dstr))
 
 print("Cálculo de std_neg y std_pos completado. Archivos guardados en:", dir_out_std)